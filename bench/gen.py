@@ -0,0 +1,117 @@
+import random
+from typing import Dict, Tuple
+
+# the generated programs keep every intermediate value within this bound, so that they never overflow at run time
+_VAL_BOUND = 1 << 20
+
+
+# generates valid miniplc0 programs which also run to the end without any `VMErr`, so that every phase (including
+# `VM.run`) can be measured; the generator evaluates each expression while generating it and picks the operators
+# accordingly, so that there is no overflow or zero division
+class ProgramGenerator(object):
+    def __init__(
+            self, seed: int = 0, n_consts: int = 16, n_vars: int = 64, n_stmts: int = 256,
+            nest_depth: int = 3, sign_rate: float = 0.3, chain_width: int = 3, print_rate: float = 0.3,
+    ):
+        self.rng = random.Random(seed)
+        self.n_consts, self.n_vars, self.n_stmts = n_consts, n_vars, n_stmts
+        self.nest_depth, self.sign_rate, self.chain_width, self.print_rate = nest_depth, sign_rate, chain_width, print_rate
+        self.values: Dict[str, int] = {}
+    
+    def generate(self) -> str:
+        self.values.clear()
+        lines = ['begin']
+        for i in range(self.n_consts):
+            name, val = f'C{i}', self.rng.randint(-100, 100)
+            lines.append(f'    const {name} = {val};')
+            self.values[name] = val
+        for i in range(self.n_vars):
+            name = f'v{i}'
+            text, val = self._expr(self.nest_depth)
+            lines.append(f'    var {name} = {text};')
+            self.values[name] = val
+        var_names = [f'v{i}' for i in range(self.n_vars)]
+        for _ in range(self.n_stmts):
+            text, val = self._expr(self.nest_depth)
+            if not var_names or self.rng.random() < self.print_rate:
+                lines.append(f'    print({text});')
+            else:
+                name = self.rng.choice(var_names)
+                lines.append(f'    {name} = {text};')
+                self.values[name] = val
+        lines.append('end')
+        return '\n'.join(lines) + '\n'
+    
+    # <expr> ::= <term>{'+'|'-'<term>}
+    def _expr(self, depth: int) -> Tuple[str, int]:
+        text, val = self._term(depth)
+        parts = [text]
+        for _ in range(self.rng.randint(0, self.chain_width - 1)):
+            rhs_text, rhs_val = self._term(depth)
+            op = self.rng.choice('+-')
+            res = val + rhs_val if op == '+' else val - rhs_val
+            if abs(res) > _VAL_BOUND:
+                op = '-' if op == '+' else '+'
+                res = val + rhs_val if op == '+' else val - rhs_val
+            parts.append(op)
+            parts.append(rhs_text)
+            val = res
+        return ' '.join(parts), val
+    
+    # <term> ::= <factor>{'*'|'/'<factor>}
+    def _term(self, depth: int) -> Tuple[str, int]:
+        text, val = self._factor(depth)
+        parts = [text]
+        for _ in range(self.rng.randint(0, self.chain_width - 1)):
+            rhs_text, rhs_val = self._factor(depth)
+            if rhs_val != 0 and (abs(val * rhs_val) > _VAL_BOUND or self.rng.random() < 0.3):
+                parts.append('/')
+                val //= rhs_val
+            elif abs(val * rhs_val) <= _VAL_BOUND:
+                parts.append('*')
+                val *= rhs_val
+            else:
+                continue
+            parts.append(rhs_text)
+        return ' '.join(parts), val
+    
+    # <factor> ::= [<sign>]( <identifier> | <unsigned_int> | '('<expr>')' )
+    def _factor(self, depth: int) -> Tuple[str, int]:
+        r = self.rng.random()
+        if depth > 0 and r < 0.25:
+            text, val = self._expr(depth - 1)
+            text = f'({text})'
+        elif self.values and r < 0.65:
+            text = self.rng.choice(list(self.values.keys()))
+            val = self.values[text]
+        else:
+            val = self.rng.randint(0, 100)
+            text = str(val)
+        # heavy unary signs: a sign may wrap the factor in brackets again and again
+        while self.rng.random() < self.sign_rate:
+            sign = self.rng.choice('+-')
+            if sign == '-':
+                val = -val
+            text = f'{sign}({text})' if text[0] in '+-' else f'{sign}{text}'
+        return text, val
+
+
+# a single (possibly very deep) parenthesized expression, like `(((((-c-1)))))` in in.in
+def nested_program(depth: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    text = 'c'
+    for _ in range(depth):
+        text = f'({rng.choice(["-", "+", ""])}{text}{rng.choice(["-1", "+1", "*1", ""])})'
+    return f'begin\n    var c = 1;\n    print({text});\nend\n'
+
+
+def scaled_program(scale: float, seed: int = 0, **kwargs) -> str:
+    base = dict(n_consts=16, n_vars=64, n_stmts=256)
+    base.update(kwargs)
+    for k in ['n_consts', 'n_vars', 'n_stmts']:
+        base[k] = max(1, int(base[k] * scale))
+    return ProgramGenerator(seed=seed, **base).generate()
+
+
+if __name__ == '__main__':
+    print(ProgramGenerator(seed=0, n_consts=2, n_vars=3, n_stmts=4, nest_depth=2).generate())
@@ -0,0 +1,260 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bench.gen import nested_program, scaled_program
+from lexical.dfa import DFATokenizer
+from lexical.tokenizer import LexicalTokenizer
+from lexical.vectorized import VectorizedTokenizer
+from syntactic.analyzer import SyntacticAnalyzer
+from utils.serializer import serialize_instructions
+from vm.impl import VM, Int32VM
+from vm.jit import clear_cache
+
+
+# each phase takes the outputs of the previous ones (kept in `ctx`) and returns (its output, the amount of work done,
+# the unit of the work); the work is what the throughput is computed against
+# a phase may also have a `prepare` step, whose result is passed in as `ctx['_prepared']` and which is neither timed
+# nor traced
+def _tokenize(ctx):
+    tokens = LexicalTokenizer(ctx['source']).parse_tokens()
+    return tokens, len(ctx['source']), 'chars'
+
+
+def _tokenize_dfa(ctx):
+    stream = DFATokenizer(ctx['source']).parse_stream()
+    return stream, len(ctx['source']), 'chars'
+
+
+def _tokenize_numpy(ctx):
+    stream = VectorizedTokenizer(ctx['source']).parse_stream()
+    return stream, len(ctx['source']), 'chars'
+
+
+def _parse(ctx):
+    stream = ctx['tokenize_dfa']
+    stream.cur = 0
+    instructions = SyntacticAnalyzer(stream).generate_instructions()
+    return instructions, len(stream), 'tokens'
+
+
+def _serialize(ctx):
+    text = serialize_instructions(ctx['parse'])
+    return text, len(ctx['parse']), 'instructions'
+
+
+def _vm_load(ctx):
+    vm = VM(instructions=ctx['serialize'])
+    return vm, len(ctx['parse']), 'instructions'
+
+
+def _prepare_vm_run(ctx):
+    # a fresh VM for every repetition
+    return VM(instructions=ctx['serialize'])
+
+
+def _vm_run(ctx):
+    vm = ctx['_prepared']
+    with contextlib.redirect_stdout(io.StringIO()):
+        vm.run()
+    return vm, len(ctx['parse']), 'instructions'
+
+
+def _prepare_vm_run_int32(ctx):
+    return Int32VM(instructions=ctx['serialize'])
+
+
+def _prepare_jit(ctx):
+    # compile from scratch for every repetition
+    clear_cache()
+    return VM(instructions=ctx['serialize'])
+
+
+def _jit(ctx):
+    vm = ctx['_prepared']
+    vm.jit(force=True)
+    return vm, len(ctx['parse']), 'instructions'
+
+
+def _prepare_vm_run_jit(ctx):
+    vm = VM(instructions=ctx['serialize'])
+    vm._jitted = ctx['jit']._jitted
+    return vm
+
+
+def _vm_run_jit(ctx):
+    vm = ctx['_prepared']
+    with contextlib.redirect_stdout(io.StringIO()):
+        vm.run(jit=True)
+    return vm, len(ctx['parse']), 'instructions'
+
+
+# name => (prepare, run)
+PHASES: Dict[str, Tuple[Optional[Callable], Callable]] = {
+    'tokenize': (None, _tokenize),
+    'tokenize_dfa': (None, _tokenize_dfa),
+    'tokenize_numpy': (None, _tokenize_numpy),
+    'parse': (None, _parse),
+    'serialize': (None, _serialize),
+    'vm_load': (None, _vm_load),
+    'vm_run': (_prepare_vm_run, _vm_run),
+    'vm_run_int32': (_prepare_vm_run_int32, _vm_run),
+    'jit': (_prepare_jit, _jit),
+    'vm_run_jit': (_prepare_vm_run_jit, _vm_run_jit),
+}
+
+
+def measure(source: str, repeat: int = 3, memory: bool = True, phases: List[str] = None) -> Dict[str, dict]:
+    phases = phases or list(PHASES.keys())
+    ctx = {'source': source}
+    results = {}
+    for name, (prepare, phase) in PHASES.items():
+        times = []
+        for _ in range(repeat if name in phases else 1):
+            ctx['_prepared'] = prepare and prepare(ctx)
+            gc.collect()
+            t0 = time.perf_counter()
+            out, work, unit = phase(ctx)
+            times.append(time.perf_counter() - t0)
+        ctx[name] = out
+        if name not in phases:
+            continue
+        best = min(times)
+        res = {
+            'seconds': best,
+            'work': work,
+            'unit': unit,
+            'throughput': work / best if best > 0 else math.inf,
+        }
+        # measured separately since tracing allocations slows everything down
+        if memory:
+            ctx['_prepared'] = prepare and prepare(ctx)
+            gc.collect()
+            tracemalloc.start()
+            phase(ctx)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            res['peak_bytes'] = peak
+        results[name] = res
+    return results
+
+
+# the slope of log(seconds) against log(size), i.e. ~1 for linear phases and ~2 for quadratic ones
+def _scaling_exponent(sizes: List[int], seconds: List[float]) -> float:
+    pts = [(math.log(s), math.log(t)) for s, t in zip(sizes, seconds) if s > 0 and t > 0]
+    if len(pts) < 2:
+        return float('nan')
+    mx = sum(x for x, _ in pts) / len(pts)
+    my = sum(y for _, y in pts) / len(pts)
+    var = sum((x - mx) ** 2 for x, _ in pts)
+    return sum((x - mx) * (y - my) for x, y in pts) / var if var else float('nan')
+
+
+def _scaling_exponents(runs: List[dict]) -> Dict[str, float]:
+    sizes = [r['source_chars'] for r in runs]
+    return {
+        name: _scaling_exponent(sizes, [r['phases'][name]['seconds'] for r in runs])
+        for name in runs[0]['phases']
+    } if runs else {}
+
+
+def run_suite(
+        scales: List[float], seed: int, repeat: int, memory: bool, phases: List[str], gen_kwargs: dict,
+        nest_depths: List[int] = (),
+) -> dict:
+    runs = []
+    for scale in scales:
+        source = scaled_program(scale, seed=seed, **gen_kwargs)
+        print(f'[bench] scale={scale} ({len(source)} chars)', file=sys.stderr)
+        runs.append({'scale': scale, 'source_chars': len(source), 'phases': measure(source, repeat, memory, phases)})
+    # a single expression nested this deep, whose cost is driven by the depth rather than by the number of statements
+    nested_runs = []
+    for depth in nest_depths:
+        source = nested_program(depth, seed=seed)
+        print(f'[bench] nested depth={depth} ({len(source)} chars)', file=sys.stderr)
+        nested_runs.append({'depth': depth, 'source_chars': len(source), 'phases': measure(source, repeat, memory, phases)})
+    
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'generator': gen_kwargs,
+        },
+        'runs': runs,
+        'scaling_exponents': _scaling_exponents(runs),
+        'nested_runs': nested_runs,
+        'nested_scaling_exponents': _scaling_exponents(nested_runs),
+    }
+
+
+# compare with a stored baseline run of the same scales (and nest depths), a ratio > 1 means slower than the baseline
+def compare(report: dict, baseline: dict, threshold: float) -> dict:
+    comparison, regressions = [], []
+    for runs_key, key in [('runs', 'scale'), ('nested_runs', 'depth')]:
+        base_runs = {r[key]: r for r in baseline.get(runs_key, [])}
+        for run in report.get(runs_key, []):
+            base = base_runs.get(run[key], None)
+            if base is None:
+                continue
+            for name, res in run['phases'].items():
+                base_res = base['phases'].get(name, None)
+                if base_res is None or base_res['seconds'] <= 0:
+                    continue
+                ratio = res['seconds'] / base_res['seconds']
+                entry = {key: run[key], 'phase': name, 'ratio': ratio}
+                if 'peak_bytes' in res and base_res.get('peak_bytes'):
+                    entry['memory_ratio'] = res['peak_bytes'] / base_res['peak_bytes']
+                comparison.append(entry)
+                if ratio > 1 + threshold:
+                    regressions.append(entry)
+    return {'entries': comparison, 'regressions': regressions, 'threshold': threshold}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='benchmarks of each phase of miniplc0')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--phases', type=str, nargs='+', default=None, choices=list(PHASES.keys()))
+    parser.add_argument('--no-memory', action='store_true', default=False, help='skip measuring the peak memory')
+    parser.add_argument('--nest-depth', type=int, default=3)
+    parser.add_argument('--nest-depths', type=int, nargs='*', default=[250, 500, 1000, 2000], help='also measure a single expression nested this deep (see `nested_program`)')
+    parser.add_argument('--sign-rate', type=float, default=0.3)
+    parser.add_argument('--chain-width', type=int, default=3)
+    parser.add_argument('-o', type=str, default=None, help='write the report (json) to this file instead of stdout')
+    parser.add_argument('--baseline', type=str, default=None, help='compare with this report (json)')
+    parser.add_argument('--threshold', type=float, default=0.1, help='the tolerated slowdown against the baseline')
+    args = parser.parse_args(argv)
+    
+    gen_kwargs = dict(nest_depth=args.nest_depth, sign_rate=args.sign_rate, chain_width=args.chain_width)
+    report = run_suite(args.scales, args.seed, args.repeat, not args.no_memory, args.phases, gen_kwargs, args.nest_depths)
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as fin:
+            report['comparison'] = compare(report, json.load(fin), args.threshold)
+        for r in report['comparison']['regressions']:
+            where = f'scale {r["scale"]}' if 'scale' in r else f'nest depth {r["depth"]}'
+            print(f'[bench] regression: {r["phase"]} at {where} is {r["ratio"]:.2f}x slower', file=sys.stderr)
+        status = 1 if report['comparison']['regressions'] else 0
+    
+    text = json.dumps(report, indent=2)
+    if args.o:
+        with open(args.o, 'w') as fout:
+            fout.write(text)
+    else:
+        print(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
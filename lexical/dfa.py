@@ -0,0 +1,149 @@
+from typing import Any, Callable, Iterator, List, TextIO, Tuple
+
+from lexical.err import UnknownTokenErr, TokArithmeticOverflowErr
+from lexical.meta import Token, TokenType, STR_TO_TOKEN_TYPE
+from lexical.stream import TokenStream
+
+# character classes (the word classes are bit flags so that a whole word can be summarized by OR-ing them)
+_WS, _SYM, _DIGIT, _ALPHA, _OTHER = 0, 1, 2, 4, 8
+
+
+def _char_class(ch: str):
+    if ch.isspace():
+        return _WS
+    if ch in STR_TO_TOKEN_TYPE:
+        return _SYM
+    if '0' <= ch <= '9':
+        return _DIGIT
+    if 'a' <= ch <= 'z' or 'A' <= ch <= 'Z':
+        return _ALPHA
+    return _OTHER
+
+
+# the table only covers ascii characters, the others are classified by `_char_class` on the fly
+_ASCII_CLASSES = {chr(o): _char_class(chr(o)) for o in range(128)}
+
+
+# a drop-in replacement of `LexicalTokenizer`: it makes one forward pass over the text with a character-class table
+# instead of copying the text once per symbol, and produces the same tokens and errors
+class DFATokenizer(object):
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, full_text: str):
+        self.raw_inputs = full_text
+
+    def parse_tokens(self) -> List[Token]:
+        tokens = []
+        append = tokens.append
+        self._scan(lambda token_type, val, _: append(Token(token_type=token_type, val=val)))
+        return tokens
+
+    def parse_stream(self) -> TokenStream:
+        stream = TokenStream()
+        self._scan(stream.append)
+        return stream
+
+    # tokenize a file chunk by chunk, yielding (token_type, val, offset) without the EOF token; each chunk is scanned up
+    # to its last blank or symbol, and the word after it is carried over to the next chunk, so the memory used is bounded
+    # by the chunk size (and the longest word) instead of the length of the file
+    @staticmethod
+    def iter_tokens(fp: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[TokenType, Any, int]]:
+        classes = _ASCII_CLASSES
+        base, carry = 0, ''
+        while True:
+            chunk = fp.read(chunk_size)
+            text = carry + chunk
+            end = len(text)
+            if chunk:
+                while end > 0:
+                    cls = classes.get(text[end - 1])
+                    if (_char_class(text[end - 1]) if cls is None else cls) <= _SYM:
+                        break
+                    end -= 1
+            tokens = []
+            append = tokens.append
+            DFATokenizer(text[:end])._scan(lambda token_type, val, offset: append((token_type, val, base + offset)))
+            yield from tokens
+            if not chunk:
+                return
+            base, carry = base + end, text[end:]
+
+    # calls `emit(token_type, val, offset)` for each token in order
+    def _scan(self, emit: Callable):
+        text, classes, symbols = self.raw_inputs, _ASCII_CLASSES, STR_TO_TOKEN_TYPE
+        n = len(text)
+        i = 0
+        while i < n:
+            ch = text[i]
+            cls = classes.get(ch)
+            if cls is None:
+                cls = _char_class(ch)
+            # skip blanks
+            if cls == _WS:
+                i += 1
+                continue
+            # parse symbols
+            if cls == _SYM:
+                emit(symbols[ch], ch, i)
+                i += 1
+                continue
+            # scan a word till the next blank or symbol, remembering which classes it contains
+            seen, j = cls, i + 1
+            while j < n:
+                c = classes.get(text[j])
+                if c is None:
+                    c = _char_class(text[j])
+                if c <= _SYM:
+                    break
+                seen |= c
+                j += 1
+            DFATokenizer._parse_word(text[i:j], i, cls, seen, emit)
+            i = j
+
+    @staticmethod
+    def _parse_word(word: str, offset: int, first_cls: int, seen: int, emit: Callable):
+        # parse unsigned integers
+        if seen == _DIGIT:
+            uint_val = int(word)
+            if uint_val > 0x7fffffff:
+                raise TokArithmeticOverflowErr
+            emit(TokenType.UNSIGNED_INTEGER, uint_val, offset)
+        # parse key words or identifiers
+        elif seen == _ALPHA or (first_cls == _ALPHA and seen == _ALPHA | _DIGIT):
+            emit(STR_TO_TOKEN_TYPE.get(word, TokenType.IDENTIFIER), word, offset)
+        # split something like "00baad" into an unsigned integer and a key word or an identifier
+        elif seen == _ALPHA | _DIGIT:
+            k = 1
+            while '0' <= word[k] <= '9':
+                k += 1
+            DFATokenizer._parse_word(word[:k], offset, _DIGIT, _DIGIT, emit)
+            DFATokenizer._parse_word(word[k:], offset + k, _ALPHA, seen, emit)
+        # the word contains non-ascii characters or something like '_', so fall back to the generic rules
+        else:
+            token_type = STR_TO_TOKEN_TYPE.get(word, None)
+            if token_type is not None:
+                emit(token_type, word, offset)
+            elif word.isdecimal():
+                uint_val = int(word)
+                if uint_val > 0x7fffffff:
+                    raise TokArithmeticOverflowErr
+                emit(TokenType.UNSIGNED_INTEGER, uint_val, offset)
+            elif word.isidentifier():
+                emit(TokenType.IDENTIFIER, word, offset)
+            else:
+                raise UnknownTokenErr(f'"{word}"')
+
+
+if __name__ == '__main__':
+    from pprint import pprint as pp
+
+    pp(
+        DFATokenizer(
+            """
+            begin
+                var 00baad = 1;
+                print(a);
+            end
+            """
+        ).parse_tokens()
+    )
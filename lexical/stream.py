@@ -0,0 +1,176 @@
+from array import array
+from typing import Any, Iterable, Iterator, List, Tuple
+
+from lexical.meta import Token, TokenType
+
+# `TokenType.value`s are small positive ints, so a token type is stored as a single byte
+_CODE_TO_TOKEN_TYPE = [None] * (max(t.value for t in TokenType) + 1)
+for _t in TokenType:
+    _CODE_TO_TOKEN_TYPE[_t.value] = _t
+_CODE_TO_TOKEN_TYPE = tuple(_CODE_TO_TOKEN_TYPE)
+_EOF_CODE = TokenType.EOF_TOKEN.value
+
+
+# a compact alternative of `List[Token]`: tokens are stored column by column in parallel arrays (type code, index of
+# the interned value, source offset), and an EOF token is always kept at the end as a sentinel
+class TokenStream(object):
+    NO_VAL = -1
+    
+    def __init__(self, tokens: Iterable[Token] = ()):
+        self.type_codes = array('B', [_EOF_CODE])
+        self.val_indices = array('i', [TokenStream.NO_VAL])
+        self.offsets = array('q', [-1])
+        self.vals = []
+        self._val_to_index = {}
+        self.cur = 0
+        for tok in tokens:
+            self.append(tok.token_type, tok.val)
+    
+    # build the whole stream at once from its columns (without the sentinel), given as the machine bytes of the arrays
+    # of type codes ('B'), value indices ('i') and offsets ('q'), see `lexical/vectorized.py`
+    @classmethod
+    def from_columns(cls, type_codes: bytes, val_indices: bytes, offsets: bytes, vals: List[Any]) -> 'TokenStream':
+        stream = cls()
+        stream.type_codes, stream.val_indices, stream.offsets = array('B'), array('i'), array('q')
+        stream.type_codes.frombytes(type_codes)
+        stream.val_indices.frombytes(val_indices)
+        stream.offsets.frombytes(offsets)
+        stream.type_codes.append(_EOF_CODE)
+        stream.val_indices.append(TokenStream.NO_VAL)
+        stream.offsets.append(-1)
+        stream.vals = vals
+        stream._val_to_index = {val: i for i, val in enumerate(vals)}
+        return stream
+    
+    def append(self, token_type: TokenType, val, offset: int = -1):
+        # intern the value
+        if val is None:
+            val_index = TokenStream.NO_VAL
+        else:
+            val_index = self._val_to_index.get(val, None)
+            if val_index is None:
+                val_index = self._val_to_index[val] = len(self.vals)
+                self.vals.append(val)
+        # overwrite the sentinel, then put it back
+        self.type_codes[-1] = token_type.value
+        self.val_indices[-1] = val_index
+        self.offsets[-1] = offset
+        self.type_codes.append(_EOF_CODE)
+        self.val_indices.append(TokenStream.NO_VAL)
+        self.offsets.append(-1)
+    
+    # cursors (they only deal with token types, values are fetched separately by `val` and `offset`)
+    def peek(self) -> TokenType:
+        return _CODE_TO_TOKEN_TYPE[self.type_codes[self.cur]]
+    
+    def get(self) -> TokenType:
+        token_type = _CODE_TO_TOKEN_TYPE[self.type_codes[self.cur]]
+        self.cur += 1
+        return token_type
+    
+    def unget(self):
+        self.cur -= 1
+    
+    # the value of the last token returned by `get`
+    @property
+    def val(self):
+        val_index = self.val_indices[self.cur - 1]
+        return None if val_index == TokenStream.NO_VAL else self.vals[val_index]
+    
+    # the source offset of the last token returned by `get` (-1 if unknown)
+    @property
+    def offset(self) -> int:
+        return self.offsets[self.cur - 1]
+    
+    # random access, materializing `Token`s on demand (mainly for debugging and dumping)
+    def __len__(self):
+        return len(self.type_codes) - 1
+    
+    def __getitem__(self, i: int) -> Token:
+        if not -len(self) <= i < len(self):
+            raise IndexError('token index out of range')
+        i %= len(self)
+        val_index = self.val_indices[i]
+        return Token(
+            token_type=_CODE_TO_TOKEN_TYPE[self.type_codes[i]],
+            val=None if val_index == TokenStream.NO_VAL else self.vals[val_index]
+        )
+    
+    def __iter__(self) -> Iterator[Token]:
+        return (self[i] for i in range(len(self)))
+    
+    def to_list(self) -> List[Token]:
+        return list(self)
+
+
+
+# the streaming counterpart of `TokenStream` for `SyntacticAnalyzer`: the tokens are pulled from an iterator of
+# (token_type, val, offset) (e.g. `DFATokenizer.iter_tokens`) on demand, and only a small window of them is kept, since
+# the analyzer never looks more than one token ahead nor steps back more than one
+# `cur` still counts the tokens from the beginning, but can only be moved inside the window
+class TokenPipe(object):
+    WINDOW = 1 << 10
+    _EOF = (TokenType.EOF_TOKEN, None, -1)
+    
+    def __init__(self, tokens: Iterator[Tuple[TokenType, Any, int]]):
+        self._tokens = iter(tokens)
+        self._window: List[Tuple[TokenType, Any, int]] = []
+        # the index of the first token in the window, and the position in the window
+        self._base = self._pos = 0
+        self._exhausted = False
+    
+    def _fill(self):
+        if len(self._window) > TokenPipe.WINDOW:
+            # keep the last token got for `val` and `unget`
+            drop = self._pos - 1
+            del self._window[:drop]
+            self._base += drop
+            self._pos -= drop
+        if self._exhausted:
+            self._window.append(TokenPipe._EOF)
+            return
+        tok = next(self._tokens, None)
+        if tok is None:
+            self._exhausted = True
+            tok = TokenPipe._EOF
+        self._window.append(tok)
+    
+    def peek(self) -> TokenType:
+        if self._pos >= len(self._window):
+            self._fill()
+        return self._window[self._pos][0]
+    
+    def get(self) -> TokenType:
+        if self._pos >= len(self._window):
+            self._fill()
+        self._pos += 1
+        return self._window[self._pos - 1][0]
+    
+    def unget(self):
+        self._pos -= 1
+    
+    @property
+    def val(self):
+        return self._window[self._pos - 1][1]
+    
+    @property
+    def offset(self) -> int:
+        return self._window[self._pos - 1][2]
+    
+    @property
+    def cur(self) -> int:
+        return self._base + self._pos
+    
+    @cur.setter
+    def cur(self, cur: int):
+        if not self._base <= cur <= self._base + len(self._window):
+            raise ValueError(f'token {cur} is out of the window')
+        self._pos = cur - self._base
+
+
+if __name__ == '__main__':
+    from pprint import pprint as pp
+    from lexical.dfa import DFATokenizer
+    
+    stream = DFATokenizer('begin var a = 1; print(a); end').parse_stream()
+    pp(list(zip(stream, stream.offsets)))
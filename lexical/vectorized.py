@@ -0,0 +1,214 @@
+import mmap
+from typing import Any, List, Optional, Tuple, Union
+
+from lexical.dfa import DFATokenizer, _ASCII_CLASSES, _SYM, _DIGIT, _ALPHA, _OTHER
+from lexical.err import TokenCompilationError
+from lexical.meta import Token, TokenType, STR_TO_TOKEN_TYPE
+from lexical.stream import TokenStream
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_SYMBOLS = [ch for ch in STR_TO_TOKEN_TYPE if len(ch) == 1 and _ASCII_CLASSES[ch] == _SYM]
+
+if np is not None:
+    # byte => its class (the non-ascii bytes are never looked up, see `_columns`)
+    _CLASSES = np.array([_ASCII_CLASSES[chr(o)] if o < 128 else _OTHER for o in range(256)], dtype=np.uint8)
+    # byte => the token type of the symbol, and its index in `_SYMBOLS`
+    _SYMBOL_CODES = np.zeros(256, dtype=np.uint8)
+    _SYMBOL_INDICES = np.zeros(256, dtype=np.int32)
+    for _i, _ch in enumerate(_SYMBOLS):
+        _SYMBOL_CODES[ord(_ch)] = STR_TO_TOKEN_TYPE[_ch].value
+        _SYMBOL_INDICES[ord(_ch)] = _i
+    _POW10 = 10 ** np.arange(11, dtype=np.int64)
+
+
+# a drop-in replacement of `DFATokenizer` for very large sources, which classifies every byte at once with numpy
+# instead of looping over the characters:
+#   the words are the runs of non-blank non-symbol characters, whose boundaries are where the "is a word character"
+#   column changes, and the classes a word contains are OR-ed together by `np.bitwise_or.reduceat`
+#   the unsigned integers are converted all together (digit times its power of ten, summed per word), and the names
+#   are interned so that each distinct one is looked up among the key words only once
+#   a word like "00baad" is split at its first letter, just like `tok_chk` of `LexicalTokenizer`
+# the tokens are then sorted by their offsets and put into the columns of a `TokenStream` directly
+# the rare cases are left to `DFATokenizer`: a word with other characters (e.g. '_') is parsed by its generic rules,
+# and a source with non-ascii characters or with an error is scanned by it from the beginning, so that the tokens and
+# the first error are exactly the same
+# without numpy, it is simply `DFATokenizer`
+class VectorizedTokenizer(object):
+    def __init__(self, source: Union[str, bytes, bytearray, memoryview, mmap.mmap]):
+        self._source = source
+
+    # map the file into memory instead of reading it (an empty file cannot be mapped)
+    # NOTE: the offsets are those of the bytes in the file, which differ from those in the text read in text mode only
+    #       if the file has '\r\n's
+    @classmethod
+    def from_file(cls, path: str) -> 'VectorizedTokenizer':
+        with open(path, 'rb') as fin:
+            try:
+                return cls(mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ))
+            except ValueError:
+                return cls(b'')
+
+    # the source as given (e.g. the mapped bytes of the file)
+    @property
+    def source(self) -> Union[str, bytes, bytearray, memoryview, mmap.mmap]:
+        return self._source
+
+    @property
+    def raw_inputs(self) -> str:
+        source = self._source
+        return source if isinstance(source, str) else bytes(source).decode('utf-8')
+
+    def parse_tokens(self) -> List[Token]:
+        stream = self.parse_stream()
+        return stream.to_list()
+
+    def parse_stream(self) -> TokenStream:
+        columns = self._columns() if np is not None else None
+        if columns is None:
+            return DFATokenizer(self.raw_inputs).parse_stream()
+        return TokenStream.from_columns(*columns)
+
+    # returns the columns for `TokenStream.from_columns`, or None if they are left to `DFATokenizer`
+    def _columns(self) -> Optional[Tuple[bytes, bytes, bytes, List[Any]]]:
+        source = self._source
+        if isinstance(source, str):
+            try:
+                data = source.encode('ascii')
+            except UnicodeEncodeError:
+                return None
+            text = source
+        else:
+            data = source
+            text = None
+        b = np.frombuffer(data, dtype=np.uint8)
+        if b.size and b.max() >= 128:
+            return None
+        if text is None:
+            text = bytes(data).decode('ascii')
+
+        cls = _CLASSES[b]
+        is_word = cls >= _DIGIT
+        edges = np.diff(is_word.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if starts.size:
+            # the blanks and symbols between the words count as nothing
+            seen = np.bitwise_or.reduceat(np.where(is_word, cls, 0), starts)
+        else:
+            seen = np.zeros(0, dtype=np.uint8)
+        first = cls[starts]
+
+        is_number = seen == _DIGIT
+        is_name = (seen == _ALPHA) | ((first == _ALPHA) & (seen == _ALPHA | _DIGIT))
+        is_split = (first == _DIGIT) & (seen == _ALPHA | _DIGIT)
+        is_other = (seen & _OTHER) != 0
+        # the first letter of each word to be split
+        letters = np.flatnonzero(cls == _ALPHA)
+        cut = letters[np.searchsorted(letters, starts[is_split])]
+
+        number_starts = np.concatenate([starts[is_number], starts[is_split]])
+        number_ends = np.concatenate([ends[is_number], cut])
+        name_starts = np.concatenate([starts[is_name], cut])
+        name_ends = np.concatenate([ends[is_name], ends[is_split]])
+
+        values = self._numbers(b, number_starts, number_ends)
+        if values is None:
+            return None
+
+        vals: List[Any] = list(_SYMBOLS)
+        symbol_offsets = np.flatnonzero(cls == _SYM)
+        symbol_codes = _SYMBOL_CODES[b[symbol_offsets]]
+        symbol_indices = _SYMBOL_INDICES[b[symbol_offsets]]
+
+        unique_values, inverse = np.unique(values, return_inverse=True)
+        number_indices = (inverse.reshape(-1) + len(vals)).astype(np.int32)
+        vals += unique_values.tolist()
+        number_codes = np.full(len(values), TokenType.UNSIGNED_INTEGER.value, dtype=np.uint8)
+
+        name_indices, name_codes = self._names(text, name_starts, name_ends, vals)
+
+        # the words with other characters follow the generic rules one by one
+        other_offsets, other_codes, other_indices = [], [], []
+        index = {val: i for i, val in enumerate(vals)}
+
+        def emit(token_type: TokenType, val, offset: int):
+            i = index.get(val)
+            if i is None:
+                i = index[val] = len(vals)
+                vals.append(val)
+            other_offsets.append(offset)
+            other_codes.append(token_type.value)
+            other_indices.append(i)
+
+        try:
+            for s, e, c, w in zip(starts[is_other].tolist(), ends[is_other].tolist(), first[is_other].tolist(), seen[is_other].tolist()):
+                DFATokenizer._parse_word(text[s:e], s, c, w, emit)
+        except TokenCompilationError:
+            return None
+
+        offsets = np.concatenate([
+            symbol_offsets, number_starts, name_starts, np.array(other_offsets, dtype=np.int64)
+        ]).astype(np.int64)
+        codes = np.concatenate([symbol_codes, number_codes, name_codes, np.array(other_codes, dtype=np.uint8)])
+        indices = np.concatenate([symbol_indices, number_indices, name_indices, np.array(other_indices, dtype=np.int32)])
+        order = np.argsort(offsets, kind='stable')
+        return (
+            codes[order].astype(np.uint8).tobytes(), indices[order].astype(np.int32).tobytes(),
+            offsets[order].tobytes(), vals
+        )
+
+    # the values of the unsigned integers spanning [starts[i], ends[i]), None if any of them overflows
+    @staticmethod
+    def _numbers(b, starts, ends):
+        if not starts.size:
+            return np.zeros(0, dtype=np.int64)
+        lengths = ends - starts
+        firsts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        # the offset of each digit, and its power of ten
+        positions = np.arange(int(lengths.sum()), dtype=np.int64) + np.repeat(starts - firsts, lengths)
+        powers = np.repeat(ends - 1, lengths) - positions
+        digits = b[positions].astype(np.int64) - ord('0')
+        # any digit but a leading zero beyond 10 ** 9 overflows
+        if np.any((digits != 0) & (powers >= 10)):
+            return None
+        values = np.add.reduceat(digits * _POW10[np.minimum(powers, 10)], firsts)
+        if np.any(values > 0x7fffffff):
+            return None
+        return values
+
+    # intern the names spanning [starts[i], ends[i]) into `vals`, each distinct one being looked up among the key words
+    # once, returns the indices and the type codes of the names
+    @staticmethod
+    def _names(text: str, starts, ends, vals: List[Any]):
+        index, codes = {}, []
+        indices = []
+        base = len(vals)
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            word = text[s:e]
+            i = index.get(word)
+            if i is None:
+                i = index[word] = len(index)
+                codes.append(STR_TO_TOKEN_TYPE.get(word, TokenType.IDENTIFIER).value)
+            indices.append(i)
+        vals += index.keys()
+        unique_codes = np.array(codes, dtype=np.uint8)
+        local = np.array(indices, dtype=np.int32)
+        return local + np.int32(base), unique_codes[local] if local.size else np.zeros(0, dtype=np.uint8)
+
+
+if __name__ == '__main__':
+    from pprint import pprint as pp
+
+    pp(
+        VectorizedTokenizer(
+            """
+            begin
+                var 00baad = 1;
+                print(a);
+            end
+            """
+        ).parse_tokens()
+    )
@@ -1,56 +1,351 @@
 import argparse
+import contextlib
+import io
+import mmap
+import os
+import sys
+import time
 import traceback
+from typing import List, Optional, Tuple, Union
 
 from lexical.err import TokenCompilationError
-from lexical.tokenizer import LexicalTokenizer
+from lexical.dfa import DFATokenizer
+from lexical.stream import TokenPipe
+from lexical.vectorized import VectorizedTokenizer
 from syntactic.analyzer import SyntacticAnalyzer
 from syntactic.err import SyntacticCompilationError
-from vm.impl import VM
+from syntactic.incremental import IncrementalCompiler
+from utils.cache import CompilationCache
+from utils.profiler import Profiler
+from utils.serializer import dump_instructions, dump_tokens, serialize_instructions
+from vm.bytecode import BytecodeWriter, dump_bytecode, is_bytecode
+from vm.err import VMVerificationErr
+from vm.evaluate import evaluate_program, lookup
+from vm.impl import VM, Int32VM
+from vm.output import StreamSink
+from vm.passes import VM_PASS, report_pass_stats, run_passes
+from vm.peephole import peephole_optimize
+from vm.scheduler import Job, Scheduler
 
 
-def main():
+# the flags of how a source is compiled (with -l), shared by miniplc0_batch.py
+def add_compile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('-b', action='store_true', default=False, help='output binary bytecode instead of text (with -l)')
+    parser.add_argument('--fold', action='store_true', default=False, help='fold constant expressions and propagate the values of constants')
+    parser.add_argument('--peephole', action='store_true', default=False, help='fuse instructions into superinstructions (only understood by this VM)')
+    parser.add_argument('--passes', type=str, required=False, default=None, help=f'run these optimization passes in order before --peephole (with -l), comma separated or "all" ({", ".join(VM_PASS.keys())})')
+    parser.add_argument('--evaluate', action='store_true', default=False, help='run the program when compiling it (with -l) on a VM of --stack-size, and emit only a LIT and a WRT for each value it prints, followed by what reproduces its run-time error if any; the results are also kept in memory by the hash of the source, the stack size and the flags')
+    parser.add_argument('--pass-stats', action='store_true', default=False, help='report the instructions, the peak stack depth and the slots after each pass to stderr')
+    parser.add_argument('--lexer', type=str, required=False, default='dfa', choices=['dfa', 'numpy'], help='the tokenizer (with -t or -l): a pass over the characters, or numpy over all of them at once for very large sources (falls back to the former without numpy)')
+    parser.add_argument('--cache-dir', type=str, required=False, default=None, help=f'cache the compilation results (with -l) in this directory (defaults to ${CompilationCache.ENV_DIR})')
+    parser.add_argument('--cache-size', type=int, required=False, default=CompilationCache.DEFAULT_MAX_BYTES >> 20, help='the maximum size of the cache in MiB')
+
+
+# turn --passes into the list of the names of the passes to run
+def resolve_passes(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    if args.passes is not None:
+        args.passes = list(VM_PASS.keys()) if args.passes == 'all' else [name for name in args.passes.split(',') if name]
+        unknown = [name for name in args.passes if name not in VM_PASS]
+        if unknown:
+            parser.error(f'unknown passes: {", ".join(unknown)}')
+
+
+def _no_phase(_name: str):
+    return contextlib.nullcontext()
+
+
+def main(argv: List[str] = None) -> int:
     parser = argparse.ArgumentParser(description='python implementation of miniplc0 by Keyu Tian')
     parser.add_argument('--eval', action='store_true', default=False)
     parser.add_argument('-t', type=str, required=False, default=None)
     parser.add_argument('-l', type=str, required=False, default=None)
     parser.add_argument('-o', type=str, required=True)
+    add_compile_arguments(parser)
+    parser.add_argument('--jit', action='store_true', default=False, help='compile the instructions into a python function before running them (with --eval); compiling costs far more than running the program once, so a long program is run as usual unless it has been compiled in this process (e.g. in a worker of the server)')
+    parser.add_argument('--stack', type=str, required=False, default='list', choices=['list', 'int32'], help='the stack of the VM: a python list, or a fixed-capacity int32 array (with --eval)')
+    parser.add_argument('--stack-size', type=int, required=False, default=VM.STACK_SIZE, help='the capacity of the stack of the VM (with --eval, or with -l: that of the VM which will run the program, whose stack overflows --passes, --peephole and --evaluate keep)')
+    parser.add_argument('--output-buffer', type=int, required=False, default=StreamSink.BUFFER_SIZE, help='how many values printed by the VM are buffered before being written out (with --eval, 0 to write them right away)')
+    parser.add_argument('--trace', type=int, required=False, default=0, help=f'on an error, dump only the code and the stack around where the VM stopped, and the last N instructions executed (with --eval); the trace is rebuilt by running the program again from the start, so it is only reported if the VM stopped within the first {VM.TRACE_REPLAY_LIMIT} instructions (VM.TRACE_REPLAY_LIMIT)')
+    parser.add_argument('--verify', action='store_true', default=False, help='verify the stack accesses of the instructions when loading them, and run them without checking the stack if they pass (with --eval)')
+    parser.add_argument('--max-instructions', type=int, required=False, default=None, help='stop the VM after this many instructions (with --eval)')
+    parser.add_argument('--max-seconds', type=float, required=False, default=None, help='stop the VM after running for this long (with --eval, checked every %d instructions)' % Scheduler.SLICE_SIZE)
+    parser.add_argument('--stream', action='store_true', default=False, help='compile the source (with -l) while reading it, writing the instructions of each statement right away, so that the memory used does not grow with the program (without the cache)')
+    parser.add_argument('--watch', action='store_true', default=False, help='keep recompiling the source (with -l) whenever it changes, redoing only the changed statements')
+    parser.add_argument('--watch-interval', type=float, required=False, default=0.2, help='how often to check the source for changes (in seconds)')
+    parser.add_argument('--profile', action='store_true', default=False, help='report the time and allocations of each phase (and the opcode histogram with --eval) to stderr')
+    parser.add_argument('--profile-json', type=str, required=False, default=None, help='also dump the profile as json to this file (implies --profile)')
     
-    args: argparse.Namespace = parser.parse_args()
+    args: argparse.Namespace = parser.parse_args(argv)
+    if args.b and args.l is None:
+        parser.error('-b can only be used with -l')
+    if args.jit and not args.eval:
+        parser.error('--jit can only be used with --eval')
+    budgeted = args.max_instructions is not None or args.max_seconds is not None
+    if budgeted and (not args.eval or args.jit):
+        parser.error('--max-instructions and --max-seconds can only be used with --eval, and without --jit')
+    if args.watch and (args.l is None or args.eval):
+        parser.error('--watch can only be used with -l')
+    if args.stream and (args.l is None or args.eval or args.watch or args.passes or args.peephole or args.evaluate):
+        parser.error('--stream can only be used with -l, and without --watch, --passes, --peephole or --evaluate (which need the whole program)')
+    if args.evaluate and args.l is None:
+        parser.error('--evaluate can only be used with -l')
+    if args.passes is not None and args.l is None:
+        parser.error('--passes can only be used with -l')
+    resolve_passes(parser, args)
     
+    profiler = Profiler() if args.profile or args.profile_json else None
+    phase = profiler.phase if profiler else _no_phase
+    try:
+        if args.watch:
+            _watch(args, phase)
+        elif args.stream:
+            _stream(args, phase)
+        else:
+            _execute(args, phase, profiler)
+    except KeyboardInterrupt:
+        if not args.watch:
+            raise
+    finally:
+        if profiler:
+            profiler.report()
+            if args.profile_json:
+                profiler.dump_json(args.profile_json)
+    return 0
+
+
+def _execute(args: argparse.Namespace, phase, profiler: Profiler):
     if args.eval:
-        with open(args.o, 'r') as fin:
-            instructions = fin.read()
-        vm = VM(instructions=instructions)
+        vm_clz = Int32VM if args.stack == 'int32' else VM
+        output = StreamSink(buffer_size=args.output_buffer)
+        with phase('vm load'):
+            try:
+                if is_bytecode(args.o):
+                    vm = vm_clz.from_bytecode(args.o, stack_size=args.stack_size, output=output, trace_size=args.trace, verify=args.verify)
+                else:
+                    with open(args.o, 'r') as fin:
+                        instructions = fin.read()
+                    vm = vm_clz(instructions=instructions, stack_size=args.stack_size, output=output, trace_size=args.trace, verify=args.verify)
+            except VMVerificationErr:
+                # nothing is run
+                traceback.print_exc()
+                return
         vm.render_segments()
-        vm.run()
+        if args.jit:
+            with phase('jit'):
+                vm.jit()
+        with phase('vm run'):
+            if args.max_instructions is not None or args.max_seconds is not None:
+                _run_with_budgets(vm, args)
+            else:
+                # the instructions are not dispatched one by one after being compiled, so there is no opcode histogram
+                vm.run(hook=None if args.jit else profiler, jit=args.jit)
         return
 
-    fout = open(args.o, 'w')
-    performing_syntactic_analysis = args.l is not None
-    with open(args.t or args.l, 'r') as fin:
-        full_text = fin.read()
-    
-    if performing_syntactic_analysis:
-        try:
-            tokens = LexicalTokenizer(full_text=full_text).parse_tokens()
-            instructions = SyntacticAnalyzer(tokens=tokens).generate_instructions()
-        except TokenCompilationError or SyntacticCompilationError:
-            traceback.print_exc()
-            instructions = []
-        for op in instructions:
-            print(op, file=fout)
-        # VM('\n'.join(str(op) for op in instructions)).run()
+    fout = open(args.o, 'wb' if args.b else 'w')
+    if args.l is not None:
+        with phase('cache'):
+            cache = CompilationCache.from_flag(args.cache_dir, args.cache_size << 20)
+        output, error = compile_source(args.l, args, phase, cache)
+        sys.stderr.write(error)
+        with phase('write'):
+            fout.write(output)
     else:
+        tokenizer, _ = _open_source(args.t, args.lexer)
         try:
-            tokens = LexicalTokenizer(full_text=full_text).parse_tokens()
-        except TokenCompilationError or SyntacticCompilationError:
+            with phase('tokenize'):
+                tokens = tokenizer.parse_stream()
+        except TokenCompilationError:
             traceback.print_exc()
             tokens = []
-        for tok in tokens:
-            print(f'{str(tok.token_type).split(".")[-1] + ("" if tok.val is None else f" {tok.val}")}', file=fout)
+        with phase('emit'):
+            dump_tokens(tokens, fout)
     
     fout.close()
 
 
+# the tokenizer of the source file, and the source it hashes for the caches
+# with `--lexer numpy`, the file is mapped into memory (see `VectorizedTokenizer.from_file`), so the source is the bytes
+# of the file, which are neither copied nor decoded
+def _open_source(path: str, lexer: str) -> Tuple[Union[DFATokenizer, VectorizedTokenizer], Union[str, bytes, mmap.mmap]]:
+    if lexer == 'numpy':
+        tokenizer = VectorizedTokenizer.from_file(path)
+        return tokenizer, tokenizer.source
+    with open(path, 'r') as fin:
+        full_text = fin.read()
+    return DFATokenizer(full_text), full_text
+
+
+# what -l writes for the source file (text, or bytecode with -b) and the error message if it fails to compile:
+# tokenize, parse, then run --passes, --peephole and --evaluate, going through the cache if any (on a hit, everything
+# is skipped)
+# it is also how miniplc0_batch.py compiles each source, so that the two drivers always agree
+def compile_source(path: str, args: argparse.Namespace, phase=_no_phase, cache: Optional[CompilationCache] = None) -> Tuple[Union[str, bytes], str]:
+    tokenizer, full_text = _open_source(path, args.lexer)
+    # what the instructions depend on besides the source: --passes, --peephole and --evaluate keep the behavior on a VM of
+    # --stack-size, so the stack size matters to them
+    flags = dict(fold=args.fold, passes=args.passes, peephole=args.peephole)
+    stack_size = args.stack_size
+    with phase('cache'):
+        key = cache and cache.key(full_text, b=args.b, evaluate=args.evaluate, stack_size=stack_size, **flags)
+        cached = cache and cache.get(key)
+    if cached is not None:
+        return cached
+    
+    error, instructions = '', None
+    if args.evaluate:
+        # a program evaluated recently is not even compiled again
+        with phase('evaluate'):
+            instructions = lookup(full_text, stack_size, flags)
+    try:
+        if instructions is None:
+            with phase('tokenize'):
+                tokens = tokenizer.parse_stream()
+            # the instructions are emitted while parsing
+            with phase('parse'):
+                instructions = SyntacticAnalyzer(tokens=tokens, fold_constants=args.fold).generate_instructions()
+            if args.passes:
+                with phase('passes'):
+                    instructions, stats = run_passes(instructions, args.passes, args.stack_size)
+                if args.pass_stats:
+                    report_pass_stats(stats)
+            if args.peephole:
+                with phase('peephole'):
+                    instructions = peephole_optimize(instructions, args.stack_size)
+            if args.evaluate:
+                with phase('evaluate'):
+                    instructions = evaluate_program(instructions, stack_size, source=full_text, flags=flags)
+    except (TokenCompilationError, SyntacticCompilationError):
+        error = traceback.format_exc()
+        instructions = []
+    with phase('emit'):
+        if args.b:
+            buf = io.BytesIO()
+            dump_bytecode(instructions, buf)
+            output = buf.getvalue()
+        else:
+            output = serialize_instructions(instructions)
+    if cache:
+        with phase('cache'):
+            cache.put(key, output, error)
+    return output, error
+
+
+# run the VM in slices (see `vm/scheduler.py`) so that it can be stopped once it runs out of a budget
+def _run_with_budgets(vm: VM, args: argparse.Namespace):
+    scheduler = Scheduler()
+    job = scheduler.submit(vm, args.o, max_instructions=args.max_instructions, max_seconds=args.max_seconds)
+    scheduler.run()
+    if job.status == Job.FAILED:
+        vm.report_error()
+    elif job.status != Job.DONE:
+        print(f'{args.o}: stopped after {job.executed} instructions ({job.status})', file=sys.stderr)
+
+
+# the tokens are scanned from the file chunk by chunk (see `DFATokenizer.iter_tokens`) and parsed as they come (see
+# `SyntacticAnalyzer.iter_instructions`), and the instructions of each statement are written out at once, so only the
+# symbols are kept in memory
+# on an error the output is truncated to that of an empty program, the same as without streaming; since the whole text
+# is tokenized before being parsed otherwise, a token error in the rest of the text takes precedence over a syntax error
+def _stream(args: argparse.Namespace, phase):
+    with open(args.l, 'r') as fin, open(args.o, 'wb' if args.b else 'w') as fout:
+        tokens = DFATokenizer.iter_tokens(fin)
+        writer = BytecodeWriter(fout) if args.b else None
+        error = ''
+        try:
+            with phase('stream'):
+                for instructions in SyntacticAnalyzer(tokens=TokenPipe(tokens), fold_constants=args.fold).iter_instructions():
+                    if writer:
+                        writer.write(instructions)
+                    else:
+                        dump_instructions(instructions, fout)
+                if writer:
+                    writer.close()
+        except (TokenCompilationError, SyntacticCompilationError) as err:
+            error = traceback.format_exc()
+            if isinstance(err, SyntacticCompilationError):
+                try:
+                    for _ in tokens:
+                        pass
+                except TokenCompilationError:
+                    error = traceback.format_exc()
+        except BaseException:
+            _truncate(fout, writer)
+            raise
+        if error:
+            _truncate(fout, writer)
+        sys.stderr.write(error)
+
+
+def _truncate(fout, writer: BytecodeWriter = None):
+    fout.seek(0)
+    fout.truncate()
+    if writer:
+        writer.abort()
+        dump_bytecode([], fout)
+
+
+# recompile the source every time it changes (until interrupted), keeping the compiled statements in memory so that
+# only the changed ones are tokenized and parsed again (see `syntactic/incremental.py`)
+# NOTE: `-b`, `--passes`, `--peephole` and `--evaluate` are applied to the whole program after each change
+def _watch(args: argparse.Namespace, phase):
+    compiler = IncrementalCompiler(fold_constants=args.fold)
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.stat(args.l).st_mtime_ns
+        except OSError:
+            mtime = last_mtime
+        if mtime == last_mtime:
+            time.sleep(args.watch_interval)
+            continue
+        last_mtime = mtime
+        with open(args.l, 'r') as fin:
+            full_text = fin.read()
+        
+        start = time.perf_counter()
+        error = ''
+        try:
+            with phase('compile'):
+                compiler.update(full_text)
+        except (TokenCompilationError, SyntacticCompilationError):
+            error = traceback.format_exc()
+        with phase('emit'):
+            if args.b or args.passes or args.peephole or args.evaluate:
+                instructions = [] if error else compiler.instructions
+                if args.passes:
+                    instructions, stats = run_passes(instructions, args.passes, args.stack_size)
+                    if args.pass_stats:
+                        report_pass_stats(stats)
+                if args.peephole:
+                    instructions = peephole_optimize(instructions, args.stack_size)
+                if args.evaluate:
+                    instructions = evaluate_program(instructions, args.stack_size)
+                if args.b:
+                    buf = io.BytesIO()
+                    dump_bytecode(instructions, buf)
+                    output = buf.getvalue()
+                else:
+                    output = serialize_instructions(instructions)
+            else:
+                output = '' if error else compiler.serialize()
+        with phase('write'):
+            # replace the output atomically, so that a VM started meanwhile never sees a partial program
+            tmp_path = args.o + '.tmp'
+            with open(tmp_path, 'wb' if args.b else 'w') as fout:
+                fout.write(output)
+            os.replace(tmp_path, args.o)
+        
+        sys.stderr.write(error)
+        elapsed = (time.perf_counter() - start) * 1e3
+        if error:
+            print(f'[watch] {args.l}: failed in {elapsed:.1f} ms', file=sys.stderr, flush=True)
+        else:
+            print(
+                f'[watch] {args.l}: {"incremental" if compiler.incremental else "full"} rebuild in {elapsed:.1f} ms'
+                f' ({compiler.reparsed_statements} statements, {compiler.reparsed_chars} chars reparsed)',
+                file=sys.stderr, flush=True
+            )
+
+
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# compile (and optionally evaluate) many programs at once across a pool of worker processes
+# the output of each source is written next to it, exactly as miniplc0.py would write it: `<stem>.plc0` is what
+# `miniplc0.py -l <source> -o <stem>.plc0` writes, `<stem>.out` what `miniplc0.py --eval -o <stem>.plc0` prints (with
+# --eval), and `<stem>.err` everything printed to stderr (only if there is any); an error in one program never stops
+# the batch, and a summary of the throughput and the latency is printed to stderr at the end
+# the sources are compiled by `miniplc0.compile_source` with the same flags as miniplc0.py (see `add_compile_arguments`)
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from miniplc0 import add_compile_arguments, compile_source, resolve_passes
+from utils.cache import CompilationCache
+from vm.impl import VM, Int32VM
+from vm.output import StreamSink
+
+# the suffixes of what is written, which are never taken as sources
+OUTPUT_SUFFIXES = ('.plc0', '.out', '.err')
+OK, COMPILE_ERROR, VM_ERROR, CRASHED = 'ok', 'compile error', 'vm error', 'crashed'
+
+
+# opened once per worker process, so that the version of the compiler is hashed only once
+_cache: Optional[CompilationCache] = None
+
+
+def _open_cache(args: argparse.Namespace) -> Optional[CompilationCache]:
+    global _cache
+    if _cache is None:
+        _cache = CompilationCache.from_flag(args.cache_dir, args.cache_size << 20)
+    return _cache
+
+
+# runs in a worker process, which handles one program at a time, so redirecting the std streams is safe here
+# returns (path, status, seconds, the size of the source)
+def _process(path: str, stem: str, args: argparse.Namespace):
+    start = time.perf_counter()
+    status, size = OK, 0
+    out, err = io.StringIO(), io.StringIO()
+    try:
+        size = os.path.getsize(path)
+        with contextlib.redirect_stderr(err):
+            output, error = compile_source(path, args, cache=_open_cache(args))
+        if error:
+            err.write(error)
+            status = COMPILE_ERROR
+        with open(stem + '.plc0', 'wb' if args.b else 'w') as fout:
+            fout.write(output)
+        
+        if args.eval:
+            vm_clz = Int32VM if args.stack == 'int32' else VM
+            if args.b:
+                vm = vm_clz.from_bytecode(stem + '.plc0', stack_size=args.stack_size, output=StreamSink(out))
+            else:
+                vm = vm_clz(output, stack_size=args.stack_size, output=StreamSink(out))
+            vm.render_segments(out)
+            with contextlib.redirect_stderr(err):
+                vm.run()
+            if vm.error is not None and status == OK:
+                status = VM_ERROR
+            with open(stem + '.out', 'w') as fout:
+                fout.write(out.getvalue())
+    except Exception:
+        err.write(traceback.format_exc())
+        status = CRASHED
+    
+    # e.g. the directory of a missing source does not exist
+    with contextlib.suppress(OSError):
+        if err.getvalue():
+            with open(stem + '.err', 'w') as fout:
+                fout.write(err.getvalue())
+        elif os.path.exists(stem + '.err'):
+            os.remove(stem + '.err')
+    return path, status, time.perf_counter() - start, size
+
+
+# a directory means every file in it (recursively) whose name matches `pattern`, anything with a wildcard is a glob,
+# and the lines of a manifest are sources as well
+def collect_sources(specs: List[str], pattern: str = '*', manifest: str = None) -> List[str]:
+    specs = list(specs)
+    if manifest is not None:
+        with open(manifest, 'r') as fin:
+            specs += [line.strip() for line in fin if line.strip() and not line.lstrip().startswith('#')]
+    
+    paths, seen = [], set()
+    for spec in specs:
+        if os.path.isdir(spec):
+            found = sorted(glob.glob(os.path.join(spec, '**', pattern), recursive=True))
+        elif glob.has_magic(spec):
+            found = sorted(glob.glob(spec, recursive=True))
+        else:
+            found = [spec]
+        for path in found:
+            if (os.path.isfile(path) or path == spec) and not path.endswith(OUTPUT_SUFFIXES) and path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+# where the outputs of each source go (without the suffix): next to it, named after its stem, unless another source has
+# the same stem (e.g. 'a.txt' and 'a.in') or is named exactly like it, then after its whole file name (e.g. 'a.txt.plc0')
+def output_stems(paths: List[str]) -> Dict[str, str]:
+    stems = {path: os.path.normpath(os.path.splitext(path)[0]) for path in paths}
+    names = {os.path.normpath(path) for path in paths}
+    counts = {}
+    for stem in stems.values():
+        counts[stem] = counts.get(stem, 0) + 1
+    return {
+        path: stem if counts[stem] == 1 and (stem not in names or stem == os.path.normpath(path)) else os.path.normpath(path)
+        for path, stem in stems.items()
+    }
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)] if sorted_values else 0.0
+
+
+def report(results: List[tuple], seconds: float, workers: int, fp=None):
+    fp = fp or sys.stderr
+    counts = {status: 0 for status in [OK, COMPILE_ERROR, VM_ERROR, CRASHED]}
+    for _, status, _, _ in results:
+        counts[status] += 1
+    latencies = sorted(latency for _, _, latency, _ in results)
+    size = sum(size for _, _, _, size in results)
+    
+    print('\n================ batch ================', file=fp)
+    print(f'{len(results)} programs in {seconds:.3f}s with {workers} workers: ' + ', '.join(f'{n} {status}' for status, n in counts.items()), file=fp)
+    print(f'throughput: {len(results) / max(seconds, 1e-9):.1f} programs/s, {size / max(seconds, 1e-9) / 1e6:.2f} MB/s of source', file=fp)
+    print(
+        f'latency (ms): mean {sum(latencies) / max(len(latencies), 1) * 1e3:.3f}, p50 {_percentile(latencies, 0.5) * 1e3:.3f},'
+        f' p90 {_percentile(latencies, 0.9) * 1e3:.3f}, p99 {_percentile(latencies, 0.99) * 1e3:.3f}, max {_percentile(latencies, 1) * 1e3:.3f}',
+        file=fp
+    )
+    for path, status, _, _ in results:
+        if status == CRASHED:
+            print(f'crashed: {path}', file=fp)
+    print('=======================================', file=fp)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='compile (and evaluate) many miniplc0 programs in parallel')
+    parser.add_argument('sources', type=str, nargs='*', help='source files, directories or globs')
+    parser.add_argument('--manifest', type=str, required=False, default=None, help='a file listing more sources, one per line')
+    parser.add_argument('--pattern', type=str, required=False, default='*', help='which files of a directory are sources')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunksize', type=int, required=False, default=None, help='how many programs are sent to a worker at a time (defaults to spreading them into 4 chunks per worker, at most 64 programs each)')
+    parser.add_argument('--eval', action='store_true', default=False, help='also run each compiled program')
+    add_compile_arguments(parser)
+    parser.add_argument('--stack', type=str, required=False, default='list', choices=['list', 'int32'])
+    parser.add_argument('--stack-size', type=int, required=False, default=VM.STACK_SIZE)
+    args = parser.parse_args(argv)
+    resolve_passes(parser, args)
+    
+    paths = collect_sources(args.sources, args.pattern, args.manifest)
+    if not paths:
+        parser.error('no sources')
+    stems = output_stems(paths)
+    renamed = [path for path in paths if stems[path] != os.path.normpath(os.path.splitext(path)[0])]
+    if renamed:
+        print(f'{len(renamed)} sources share their stems with others, so their outputs are named after the whole file names, e.g. {stems[renamed[0]]}.plc0', file=sys.stderr)
+    workers = max(1, min(args.workers or 1, len(paths)))
+    chunksize = args.chunksize or max(1, min(64, len(paths) // (workers * 4)))
+    
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_process(path, stems[path], args) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_process, paths, [stems[path] for path in paths], [args] * len(paths), chunksize=chunksize))
+    report(results, time.perf_counter() - start, workers)
+    return 1 if any(status == CRASHED for _, status, _, _ in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
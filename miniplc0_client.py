@@ -0,0 +1,73 @@
+# a thin client of miniplc0_server.py accepting the same flags as miniplc0.py (plus --socket)
+# it deliberately imports nothing of the compiler, unless the server is not running and it has to fall back to
+# compiling locally
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+ENV_SOCKET = 'MINIPLC0_SOCKET'
+_LEN = struct.Struct('>I')
+
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+# the same as `default_socket` of miniplc0_server.py, or None if its directory may belong to someone else
+def _default_socket():
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', None)
+    if not runtime_dir:
+        runtime_dir = os.path.join(tempfile.gettempdir(), f'miniplc0-{os.getuid()}')
+    try:
+        st = os.stat(runtime_dir)
+    except OSError:
+        return None
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        return None
+    return os.path.join(runtime_dir, 'miniplc0.sock')
+
+
+def main(argv=None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    socket_path = os.environ.get(ENV_SOCKET, None)
+    if '--socket' in argv:
+        i = argv.index('--socket')
+        if i + 1 >= len(argv):
+            print('miniplc0_client.py: error: argument --socket: expected one argument', file=sys.stderr)
+            return 2
+        socket_path = argv[i + 1]
+        del argv[i:i + 2]
+    socket_path = socket_path or _default_socket()
+    
+    try:
+        if socket_path is None:
+            raise FileNotFoundError
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+    except OSError:
+        import miniplc0
+        return miniplc0.main(argv)
+    
+    with sock:
+        env = {k: v for k, v in os.environ.items() if k.startswith('MINIPLC0_')}
+        data = json.dumps(dict(argv=argv, cwd=os.getcwd(), env=env)).encode('utf-8')
+        sock.sendall(_LEN.pack(len(data)) + data)
+        n, = _LEN.unpack(_recv_exactly(sock, _LEN.size))
+        resp = json.loads(_recv_exactly(sock, n).decode('utf-8'))
+    sys.stdout.write(resp['stdout'])
+    sys.stderr.write(resp['stderr'])
+    return resp['status']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
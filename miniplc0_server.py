@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import errno
+import importlib
+import io
+import json
+import os
+import pkgutil
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+ENV_SOCKET = 'MINIPLC0_SOCKET'
+
+# every message is a big-endian u32 length followed by that many bytes of utf-8 encoded json
+_LEN = struct.Struct('>I')
+# the options of miniplc0.py which never return (they would tie up a worker for good), rejected before a job is run
+REJECTED_OPTIONS = ('--watch',)
+
+
+def send_msg(sock, obj):
+    data = json.dumps(obj).encode('utf-8')
+    sock.sendall(_LEN.pack(len(data)) + data)
+
+
+def recv_msg(sock):
+    def recv_exactly(n):
+        chunks = []
+        while n > 0:
+            chunk = sock.recv(min(n, 1 << 20))
+            if not chunk:
+                raise ConnectionError('connection closed')
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+    
+    n, = _LEN.unpack(recv_exactly(_LEN.size))
+    return json.loads(recv_exactly(n).decode('utf-8'))
+
+
+# a per-user path, so that no other user can listen in place of the daemon: in `$XDG_RUNTIME_DIR`, or else in a
+# directory of the temporary directory only accessible by the user (the same as in miniplc0_client.py)
+def default_socket() -> str:
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', None)
+    if not runtime_dir:
+        runtime_dir = os.path.join(tempfile.gettempdir(), f'miniplc0-{os.getuid()}')
+    return os.path.join(runtime_dir, 'miniplc0.sock')
+
+
+# create the directory of the default socket if needed, and make sure that nobody else owns it or can write to it
+def _prepare_socket_dir(socket_path: str):
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    if not os.path.isdir(socket_dir):
+        os.makedirs(socket_dir, mode=0o700)
+    st = os.stat(socket_dir)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(errno.EPERM, 'the directory of the socket is not owned by the user or writable by others', socket_dir)
+
+
+def _is_listening(socket_path: str) -> bool:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+# the error message if the request is not what miniplc0_client.py sends
+def _malformed(req) -> Optional[str]:
+    if not isinstance(req, dict):
+        return 'the request is not an object'
+    if not isinstance(req.get('argv', None), list) or not all(isinstance(arg, str) for arg in req['argv']):
+        return '"argv" is not a list of strings'
+    if not isinstance(req.get('cwd', None), str):
+        return '"cwd" is not a string'
+    env = req.get('env', {})
+    if not isinstance(env, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in env.items()):
+        return '"env" is not a mapping of strings'
+    return None
+
+
+# the rejected option in the argv of a job if any (including its abbreviations, which argparse accepts as well)
+def _rejected_option(argv: List[str]):
+    for arg in argv:
+        if arg == '--':
+            break
+        name = arg.split('=', 1)[0]
+        if len(name) > 2 and name.startswith('--'):
+            for option in REJECTED_OPTIONS:
+                if option.startswith(name):
+                    return option
+    return None
+
+
+def _init_worker():
+    # pay for importing the whole compiler (and the registries) once per worker instead of once per job
+    import miniplc0  # noqa: F401
+    from utils.cache import COMPILER_PACKAGES, compiler_version
+    for pkg in COMPILER_PACKAGES:
+        for info in pkgutil.iter_modules([os.path.join(os.path.dirname(os.path.abspath(miniplc0.__file__)), pkg)]):
+            importlib.import_module(f'{pkg}.{info.name}')
+    # the version of the compiler this worker runs is hashed right after loading it, and it is kept for the caches of
+    # all the jobs (see `compiler_version`), even if the sources are edited while the daemon runs
+    compiler_version()
+
+
+# runs in a worker process, which handles one job at a time, so redirecting the std streams and changing the
+# working directory are safe here
+def _run_job(argv: List[str], cwd: str, env: Dict[str, str]) -> Tuple[str, str, int]:
+    import miniplc0
+    
+    out, err = io.StringIO(), io.StringIO()
+    saved_argv = sys.argv
+    sys.argv = ['miniplc0.py'] + argv
+    saved_env = {k: os.environ.get(k, None) for k in env}
+    os.environ.update(env)
+    try:
+        os.chdir(cwd)
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                status = miniplc0.main(argv) or 0
+            except SystemExit as e:  # raised by argparse
+                status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception:
+                traceback.print_exc()
+                status = 1
+    finally:
+        sys.argv = saved_argv
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+    return out.getvalue(), err.getvalue(), status
+
+
+class _JobHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            req = recv_msg(self.request)
+        except (ConnectionError, ValueError):
+            return
+        malformed = _malformed(req)
+        rejected = None if malformed else _rejected_option(req['argv'])
+        if malformed is not None:
+            stdout, stderr, status = '', f'miniplc0_server.py: malformed request: {malformed}\n', 2
+        elif rejected is not None:
+            # the same status as a usage error reported by argparse
+            stdout, stderr, status = '', f'miniplc0_server.py: {rejected} cannot be used through the server\n', 2
+        else:
+            try:
+                stdout, stderr, status = self.server.pool.submit(_run_job, req['argv'], req['cwd'], req.get('env', {})).result()
+            except Exception:
+                stdout, stderr, status = '', traceback.format_exc(), 1
+        try:
+            send_msg(self.request, dict(stdout=stdout, stderr=stderr, status=status))
+        except OSError:
+            pass
+
+
+# each connection is handled by a thread which hands the job over to the worker pool and waits for the result
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    
+    def __init__(self, socket_path: str, workers: int = None):
+        if os.path.exists(socket_path):
+            # a stale socket is left by a daemon which did not exit gracefully, a live one belongs to a running daemon
+            if _is_listening(socket_path):
+                raise OSError(errno.EADDRINUSE, 'another server is listening on the socket', socket_path)
+            os.remove(socket_path)
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        # start all the workers now rather than on the first jobs
+        for f in [self.pool.submit(int) for _ in range(self.pool._max_workers)]:
+            f.result()
+        super(CompileServer, self).__init__(socket_path, _JobHandler)
+    
+    def server_close(self):
+        super(CompileServer, self).server_close()
+        self.pool.shutdown(wait=False)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='the compile/eval daemon of miniplc0, see miniplc0_client.py')
+    parser.add_argument('--socket', type=str, default=os.environ.get(ENV_SOCKET, None), help='defaults to a per-user path, see `default_socket`')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+    
+    # exit (and remove the socket file) gracefully on `kill`
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        if not args.socket:
+            args.socket = default_socket()
+            _prepare_socket_dir(args.socket)
+        server = CompileServer(args.socket, args.workers)
+    except OSError as e:
+        print(f'miniplc0_server.py: cannot listen on {args.socket}: {e}', file=sys.stderr)
+        return 1
+    with server:
+        print(f'miniplc0 server listening on {args.socket} with {args.workers} workers', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
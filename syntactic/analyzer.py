@@ -1,251 +1,354 @@
-from vm.op import VMOperator, VM_OP_CLZ
-from typing import List
+from vm.err import VMArithmeticOverflowErr, VMZeroDivisionErr
+from vm.op import VMOperator, VM_OP_CLZ, calc
+from typing import Iterator, List, Optional, Union
 
 from lexical.meta import Token, TokenType
+from lexical.stream import TokenStream, TokenPipe
 from syntactic.err import SynProcessErr, SynDeclarationErr, SynStatementErr, SynExpressionErr, SynAssignmentErr, SynOutputErr, SynFactorErr
+from syntactic.err import SynArithmeticOverflowErr, SynZeroDivisionErr
+from syntactic.symbols import SymbolTable, CONST, INITIALIZED
+
+# operator token => (the operator for `calc`, the instruction)
+_BINARY_OPERATORS = {
+    TokenType.PLUS_SIGN: ('+', 'ADD'),
+    TokenType.MINUS_SIGN: ('-', 'SUB'),
+    TokenType.MULTIPLICATION_SIGN: ('*', 'MUL'),
+    TokenType.DIVISION_SIGN: ('//', 'DIV'),
+}
 
 
 class SyntacticAnalyzer(object):
-    def __init__(self, tokens: List[Token]):
-        self.tokens = tokens + [Token(TokenType.EOF_TOKEN, None)]
-        self.uninitialized_vars, self.initialized_vars, self.constant_vars = {}, {}, {}
-        self.all_vars = {}
+    def __init__(self, tokens: Union[List[Token], TokenStream, TokenPipe], fold_constants: bool = False):
+        # the stream already ends with an EOF sentinel
+        self.tokens = tokens if isinstance(tokens, (TokenStream, TokenPipe)) else TokenStream(tokens)
+        self.fold_constants = fold_constants
+        # the consts and vars, see `syntactic/symbols.py`
+        self.symbols = SymbolTable()
         self.instructions: List[VMOperator] = []
         self.cur = 0
-        self.stack_offset = 0
-
+    
+    # NOTE: `get` and `peek` only return the token type, the value of the last got token is `val`
     @property
-    def get(self):
-        tok = self.tokens[self.cur]
-        self.cur += 1
-        return tok
+    def get(self) -> TokenType:
+        return self.tokens.get()
     
     @property
-    def peek(self):
-        return self.tokens[self.cur]
+    def peek(self) -> TokenType:
+        return self.tokens.peek()
+    
+    @property
+    def val(self):
+        return self.tokens.val
     
     def unget(self):
-        self.cur -= 1
+        self.tokens.unget()
+    
+    @property
+    def cur(self):
+        return self.tokens.cur
+    
+    @cur.setter
+    def cur(self, cur):
+        self.tokens.cur = cur
     
     def generate_instructions(self) -> List[VMOperator]:
         # initialize
-        [c.clear() for c in [
-            self.uninitialized_vars,
-            self.initialized_vars,
-            self.constant_vars,
-            self.all_vars,
-            self.instructions
-        ]]
-        self.cur = self.stack_offset = 0
+        self.symbols = SymbolTable()
+        self.instructions.clear()
+        self.cur = 0
         
         # parse 'begin'
-        if self.get.token_type != TokenType.BEGIN:
+        if self.get != TokenType.BEGIN:
             raise SynProcessErr('"begin" missing')
         # parse <main_process>
         self.parse_main_process()
-        # parse 'end'
-        if self.get.token_type != TokenType.END:
-            raise SynProcessErr('"end" missing')
-        # parse EOF
-        if self.get.token_type != TokenType.EOF_TOKEN:
-            raise SynProcessErr('trails found after the "end"')
+        # parse 'end', EOF
+        self.parse_process_end()
         return self.instructions
 
-    # <main_process> ::= {<const_decl>}{<var_decl>}{<statement>}
-    def parse_main_process(self):
+    # the same as `generate_instructions`, but yields the instructions of each declaration and statement (possibly none)
+    # as soon as it is parsed and forgets them, so that a program can be compiled from a `TokenPipe` with memory bounded by the symbols
+    def iter_instructions(self) -> Iterator[List[VMOperator]]:
+        # initialize
+        self.symbols = SymbolTable()
+        self.instructions = []
+        
+        # parse 'begin'
+        if self.get != TokenType.BEGIN:
+            raise SynProcessErr('"begin" missing')
         # parse <const_decl>s
-        while self.peek.token_type == TokenType.CONST:
+        while self.peek == TokenType.CONST:
             self.parse_const_decl()
+            yield self._take_instructions()
         # parse <var_decl>s
-        while self.peek.token_type == TokenType.VAR:
+        while self.peek == TokenType.VAR:
             self.parse_var_decl()
+            yield self._take_instructions()
+        # parse <statement>s
+        while self.peek != TokenType.END:
+            self.parse_statement()
+            yield self._take_instructions()
+        # parse 'end', EOF
+        self.parse_process_end()
+    
+    def _take_instructions(self) -> List[VMOperator]:
+        instructions, self.instructions = self.instructions, []
+        return instructions
+    
+    # <main_process> ::= {<const_decl>}{<var_decl>}{<statement>}
+    def parse_main_process(self):
+        # parse <const_decl>s, <var_decl>s
+        self.parse_declarations()
         # parse <statement>s
-        while self.peek.token_type != TokenType.END:
+        while self.peek != TokenType.END:
             self.parse_statement()
 
+    # {<const_decl>}{<var_decl>}
+    def parse_declarations(self):
+        # parse <const_decl>s
+        while self.peek == TokenType.CONST:
+            self.parse_const_decl()
+        # parse <var_decl>s
+        while self.peek == TokenType.VAR:
+            self.parse_var_decl()
+
+    # 'end' EOF
+    def parse_process_end(self):
+        # parse 'end'
+        if self.get != TokenType.END:
+            raise SynProcessErr('"end" missing')
+        # parse EOF
+        if self.get != TokenType.EOF_TOKEN:
+            raise SynProcessErr('trails found after the "end"')
+
     # <const_decl> ::= 'const'<identifier>'='<const_expr>';'
     def parse_const_decl(self):
         # parse 'const'
-        if self.get.token_type != TokenType.CONST:
+        if self.get != TokenType.CONST:
             raise SynDeclarationErr('"const" missing')
         # parse <identifier>
-        ident = self.get
-        if ident.token_type != TokenType.IDENTIFIER:
+        if self.get != TokenType.IDENTIFIER:
             raise SynDeclarationErr('identifier missing')
+        var_name = self.val
         # parse '='
-        if self.get.token_type != TokenType.EQUAL_SIGN:
+        if self.get != TokenType.EQUAL_SIGN:
             raise SynDeclarationErr('"=" missing')
         # parse <const_expr>
-        self.parse_const_expr()
+        const_val = self.parse_const_expr()
         # parse ';'
-        if self.get.token_type != TokenType.SEMICOLON:
+        if self.get != TokenType.SEMICOLON:
             raise SynDeclarationErr('";" missing')
         # perform
-        self._declare_var(var_name=ident.val, initialized=True, const=True)
+        self._declare_var(var_name=var_name, initialized=True, const=True, const_val=const_val)
 
     # <const_expr> ::= [<sign>]<unsigned_int>
-    def parse_const_expr(self):
+    # NOTE: the value will be returned as well
+    def parse_const_expr(self) -> int:
         # parse [<sign>]
         sign = 1
         tok = self.get
-        if tok.token_type in {TokenType.PLUS_SIGN, TokenType.MINUS_SIGN}:
-            sign = 1 if tok.token_type == TokenType.PLUS_SIGN else -1
+        if tok in {TokenType.PLUS_SIGN, TokenType.MINUS_SIGN}:
+            sign = 1 if tok == TokenType.PLUS_SIGN else -1
             tok = self.get
         # parse <unsigned_int>
-        if tok.token_type != TokenType.UNSIGNED_INTEGER:
+        if tok != TokenType.UNSIGNED_INTEGER:
             raise SynExpressionErr('unsigned int missing')
         # perform
-        self.instructions.append(VM_OP_CLZ['LIT'](sign * tok.val))
+        const_val = sign * self.val
+        self.instructions.append(VM_OP_CLZ['LIT'](const_val))
+        return const_val
 
     # <var_decl> ::= 'var'<identifier>['='<expr>]';'
     def parse_var_decl(self):
         # parse 'var'
-        if self.get.token_type != TokenType.VAR:
+        if self.get != TokenType.VAR:
             raise SynDeclarationErr('"var" missing')
         # parse <identifier>
-        ident = self.get
-        if ident.token_type != TokenType.IDENTIFIER:
+        if self.get != TokenType.IDENTIFIER:
             raise SynDeclarationErr('identifier missing')
+        var_name = self.val
         tok = self.get
         # parse '=', <expr>, ';'
-        if tok.token_type == TokenType.EQUAL_SIGN:
+        if tok == TokenType.EQUAL_SIGN:
             initialized = True
             self.parse_expr()
-            if self.get.token_type != TokenType.SEMICOLON:
+            if self.get != TokenType.SEMICOLON:
                 raise SynDeclarationErr('";" missing')
         # parse ';'
-        elif tok.token_type == TokenType.SEMICOLON:
+        elif tok == TokenType.SEMICOLON:
             initialized = False
         else:
-            raise SynDeclarationErr(f'"=" or ";" missing in the declaration of var "{ident.val}"')
+            raise SynDeclarationErr(f'"=" or ";" missing in the declaration of var "{var_name}"')
         # perform
-        self._declare_var(var_name=ident.val, initialized=initialized, const=False)
+        self._declare_var(var_name=var_name, initialized=initialized, const=False)
 
     # <statement> ::= <assignment> | <output> | ';'
     def parse_statement(self):
         # parse <assignment>
-        if self.peek.token_type == TokenType.IDENTIFIER:
+        if self.peek == TokenType.IDENTIFIER:
             self.parse_assignment()
         # parse <output>
-        elif self.peek.token_type == TokenType.PRINT:
+        elif self.peek == TokenType.PRINT:
             self.parse_output()
         # parse ';'
-        elif self.peek.token_type == TokenType.SEMICOLON:
+        elif self.peek == TokenType.SEMICOLON:
             _ = self.get
         else:
-            raise SynStatementErr(f'unknown statement (starts with {self.peek.token_type})')
+            raise SynStatementErr(f'unknown statement (starts with {self.peek})')
 
     # <assignment> ::= <identifier>'='<expr>';'
     def parse_assignment(self):
         # parse <identifier>
-        ident = self.get
-        if ident.token_type != TokenType.IDENTIFIER:
+        if self.get != TokenType.IDENTIFIER:
             raise SynAssignmentErr('identifier missing')
-        var_name = ident.val
-        if var_name in self.constant_vars:
-            raise SynAssignmentErr(f'assignment of read-only var "{var_name}"')
-        var_offset = self.all_vars.get(var_name, None)
+        var_name = self.val
+        var_offset = self.symbols.lookup(var_name)
         if var_offset is None:
             raise SynAssignmentErr(f'assignment of undefined var "{var_name}"')
+        if self.symbols.flags[var_offset] & CONST:
+            raise SynAssignmentErr(f'assignment of read-only var "{var_name}"')
         # parse '='
-        if self.get.token_type != TokenType.EQUAL_SIGN:
+        if self.get != TokenType.EQUAL_SIGN:
             raise SynAssignmentErr('"=" missing')
         # parse <expr>
         self.parse_expr()
         # parse ';'
-        if self.get.token_type != TokenType.SEMICOLON:
+        if self.get != TokenType.SEMICOLON:
             raise SynAssignmentErr('";" missing')
         # perform
-        if var_name in self.uninitialized_vars:
-            self.initialized_vars[var_name] = var_offset
-            self.uninitialized_vars.pop(var_name)
+        self.symbols.flags[var_offset] |= INITIALIZED
         self.instructions.append(VM_OP_CLZ['STO'](var_offset))
 
     # <output> ::= 'print''(' <expr> ')'';'
     def parse_output(self):
         # parse 'print'
-        if self.get.token_type != TokenType.PRINT:
+        if self.get != TokenType.PRINT:
             raise SynOutputErr('"print" missing')
         # parse '('
-        if self.get.token_type != TokenType.LEFT_BRACKET:
+        if self.get != TokenType.LEFT_BRACKET:
             raise SynOutputErr('"(" missing')
         # parse <expr>
         self.parse_expr()
         # parse ')'
-        if self.get.token_type != TokenType.RIGHT_BRACKET:
+        if self.get != TokenType.RIGHT_BRACKET:
             raise SynOutputErr('")" missing')
         # parse ';'
-        if self.get.token_type != TokenType.SEMICOLON:
+        if self.get != TokenType.SEMICOLON:
             raise SynOutputErr('";" missing')
         # perform
         self.instructions.append(VM_OP_CLZ['WRT']())
 
-    # <expr> ::= <term>{'+'|'-'<term>}
-    # NOTE: the result will be stored at the top of vm.stack
-    def parse_expr(self):
-        # parse the first <term>
-        self.parse_term()
-        # parse subsequent <term>s
-        while self.peek.token_type in [TokenType.PLUS_SIGN, TokenType.MINUS_SIGN]:
-            pm = self.get
-            self.parse_term()
-            # perform
-            self.instructions.append(VM_OP_CLZ['ADD' if pm.token_type == TokenType.PLUS_SIGN else 'SUB']())
-
-    # <term> ::= <factor>{'*'|'/'<factor>}
-    # NOTE: the result will be stored at the top of vm.stack
-    def parse_term(self):
-        # parse the first <factor>
-        self.parse_factor()
-        # parse subsequent <factor>s
-        while self.peek.token_type in [TokenType.MULTIPLICATION_SIGN, TokenType.DIVISION_SIGN]:
-            md = self.get
-            self.parse_factor()
-            # perform
-            self.instructions.append(VM_OP_CLZ['MUL' if md.token_type == TokenType.MULTIPLICATION_SIGN else 'DIV']())
-
+    # <expr>   ::= <term>{'+'|'-'<term>}
+    # <term>   ::= <factor>{'*'|'/'<factor>}
     # <factor> ::= [<sign>]( <identifier> | <unsigned_int> | '('<expr>')' )
     # NOTE: the result will be stored at the top of vm.stack
-    def parse_factor(self):
-        # parse [<sign>]
-        tok = self.get
-        signed = None
-        if tok.token_type in [TokenType.PLUS_SIGN, TokenType.MINUS_SIGN]:
-            signed = 1 if tok.token_type == TokenType.PLUS_SIGN else -1
+    # NOTE: if `fold_constants` is on and the value is known at compile time, it is returned as well (otherwise None)
+    # NOTE: instead of recursion (which costs several python frames per bracket), the nested <expr>s are kept in an
+    #       explicit stack, so the nesting depth is only limited by memory; the instructions and the errors are exactly
+    #       the same as those of a recursive descent
+    def parse_expr(self) -> Optional[int]:
+        instructions = self.instructions
+        # the states of the enclosing <expr>s, saved when entering '('
+        frames = []
+        # the current <expr> and <term>: where their instructions start, their values and the pending operators
+        e_start = t_start = len(instructions)
+        e_val = t_val = e_op = t_op = None
+        while True:
+            # parse [<sign>] of a <factor>
+            f_start = len(instructions)
             tok = self.get
+            signed = None
+            if tok in [TokenType.PLUS_SIGN, TokenType.MINUS_SIGN]:
+                signed = 1 if tok == TokenType.PLUS_SIGN else -1
+                tok = self.get
+            # parse '(', and then the nested <expr>
+            if tok == TokenType.LEFT_BRACKET:
+                frames.append((e_start, e_val, e_op, t_start, t_val, t_op, f_start, signed))
+                e_start = t_start = len(instructions)
+                e_val = t_val = e_op = t_op = None
+                continue
+            # parse <identifier> | <unsigned_int>
+            val = self._parse_operand(tok)
+            
+            while True:
+                # perform [<sign>], the <factor> ends here
+                if signed is not None:
+                    if val is not None:
+                        val = self._fold(f_start, val, '*', signed)
+                    else:
+                        instructions.append(VM_OP_CLZ['LIT'](signed))
+                        instructions.append(VM_OP_CLZ['MUL']())
+                t_val = val if t_op is None else self._perform(t_start, t_val, t_op, val)
+                # parse '*'|'/', and then the next <factor> of the <term>
+                if self.peek in [TokenType.MULTIPLICATION_SIGN, TokenType.DIVISION_SIGN]:
+                    t_op = self.get
+                    break
+                # the <term> ends here
+                e_val = t_val if e_op is None else self._perform(e_start, e_val, e_op, t_val)
+                # parse '+'|'-', and then the next <term> of the <expr>
+                if self.peek in [TokenType.PLUS_SIGN, TokenType.MINUS_SIGN]:
+                    e_op = self.get
+                    t_start, t_val, t_op = len(instructions), None, None
+                    break
+                # the <expr> ends here
+                if not frames:
+                    return e_val
+                # parse ')', the <factor> in the enclosing <expr> ends here
+                if self.get != TokenType.RIGHT_BRACKET:
+                    raise SynFactorErr('")" missing')
+                val = e_val
+                e_start, e_val, e_op, t_start, t_val, t_op, f_start, signed = frames.pop()
+
+    # <identifier> | <unsigned_int> in a <factor>
+    def _parse_operand(self, tok: TokenType) -> Optional[int]:
         # parse <identifier>
-        if tok.token_type == TokenType.IDENTIFIER:
-            var_name = tok.val
-            var_offset = self.all_vars.get(var_name, None)
+        if tok == TokenType.IDENTIFIER:
+            var_name = self.val
+            symbols = self.symbols
+            var_offset = symbols.offsets.get(var_name)
             if var_offset is None:
                 raise SynFactorErr(f'reference of undefined var "{var_name}"')
-            if var_name in self.uninitialized_vars:
+            flags = symbols.flags[var_offset]
+            if not flags & INITIALIZED:
                 raise SynFactorErr(f'reference of uninitialized var "{var_name}"')
+            # propagate the value of a constant
+            if self.fold_constants and flags & CONST:
+                val = symbols.values[var_offset]
+                self.instructions.append(VM_OP_CLZ['LIT'](val))
+                return val
             self.instructions.append(VM_OP_CLZ['LOD'](var_offset))
+            return None
         # parse <unsigned_int>
-        elif tok.token_type == TokenType.UNSIGNED_INTEGER:
-            self.instructions.append(VM_OP_CLZ['LIT'](tok.val))
-        # parse '(', <expr>, ')'
-        elif tok.token_type == TokenType.LEFT_BRACKET:
-            self.parse_expr()
-            if self.get.token_type != TokenType.RIGHT_BRACKET:
-                raise SynFactorErr('")" missing')
+        elif tok == TokenType.UNSIGNED_INTEGER:
+            self.instructions.append(VM_OP_CLZ['LIT'](self.val))
+            return self.val if self.fold_constants else None
         else:
             raise SynFactorErr(f'identifier or uint or (expr) missing')
-        # perform
-        if signed is not None:
-            self.instructions.append(VM_OP_CLZ['LIT'](signed))
-            self.instructions.append(VM_OP_CLZ['MUL']())
 
-    def _declare_var(self, var_name: str, initialized: bool, const: bool):
-        if var_name in self.all_vars:
+    # perform a binary operator of an <expr> or a <term> (starting from `start`)
+    def _perform(self, start: int, lhs: Optional[int], op: TokenType, rhs: Optional[int]) -> Optional[int]:
+        if lhs is not None and rhs is not None:
+            return self._fold(start, lhs, _BINARY_OPERATORS[op][0], rhs)
+        self.instructions.append(VM_OP_CLZ[_BINARY_OPERATORS[op][1]]())
+        return None
+
+    # replace the instructions computing a constant (starting from `start`) by a single LIT, raising the errors at
+    # compile time which would be raised by the VM at run time
+    def _fold(self, start: int, lhs: int, op: str, rhs: int) -> int:
+        try:
+            val = calc(lhs, op, rhs)
+        except VMArithmeticOverflowErr:
+            raise SynArithmeticOverflowErr(f'{lhs} {op} {rhs}')
+        except VMZeroDivisionErr:
+            raise SynZeroDivisionErr(f'{lhs} {op} {rhs}')
+        del self.instructions[start:]
+        self.instructions.append(VM_OP_CLZ['LIT'](val))
+        return val
+
+    def _declare_var(self, var_name: str, initialized: bool, const: bool, const_val: int = None):
+        if self.symbols.lookup(var_name) is not None:
             raise SynDeclarationErr(f'redeclaration of var "{var_name}"')
-        if const:
-            vs = self.constant_vars
-        else:
-            vs = self.initialized_vars if initialized else self.uninitialized_vars
-        self.all_vars[var_name] = vs[var_name] = self.stack_offset
-        self.stack_offset += 1
+        self.symbols.declare(var_name, const=const, initialized=initialized, value=0 if const_val is None else const_val)
 
 
 if __name__ == '__main__':
@@ -28,3 +28,11 @@ class SynExpressionErr(SyntacticCompilationError):
 
 class SynFactorErr(SyntacticCompilationError):
     pass
+
+
+class SynArithmeticOverflowErr(SyntacticCompilationError):
+    pass
+
+
+class SynZeroDivisionErr(SyntacticCompilationError):
+    pass
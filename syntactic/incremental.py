@@ -0,0 +1,182 @@
+from typing import Dict, List, Optional
+
+from lexical.dfa import DFATokenizer
+from lexical.meta import TokenType
+from syntactic.analyzer import SyntacticAnalyzer
+from syntactic.err import SynProcessErr
+from syntactic.symbols import SymbolTable, INITIALIZED
+from utils.serializer import serialize_instructions
+from vm.op import VMOperator, VM_OP_CLZ
+
+_STO = VM_OP_CLZ['STO']
+
+
+# the compiled result of one <statement>
+class _Statement(object):
+    __slots__ = ['instructions', 'text', 'assigned', 'index']
+    
+    def __init__(self, instructions: List[VMOperator]):
+        self.instructions = instructions
+        self.text = serialize_instructions(instructions)
+        # the stack offset of the var it assigns
+        self.assigned = instructions[-1].operand if len(instructions) and type(instructions[-1]) is _STO else None
+        # its position among the statements
+        self.index = -1
+
+
+def _common_prefix_len(a: str, b: str, limit: int) -> int:
+    # binary search with slice comparisons, which run at the speed of memcmp
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_len(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if a[len(a) - mid:len(a) - lo] == b[len(b) - mid:len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+# recompiles a source text after each change, redoing only the statements touched by the change
+# since ';' only terminates declarations and statements, every ';' after the declarations ends exactly one statement,
+# so the text between the last ';' before the change and the first ';' after it is a run of whole statements which can
+# be tokenized and parsed on its own; the instructions of each statement are kept separately and spliced together
+# it falls back to a full rebuild when the change touches the declarations, when the first statement turns into a
+# declaration, when an 'end' shows up among the statements, or when the change alters which uninitialized vars get
+# assigned (which decides whether the later statements may reference them)
+# the results and the errors are exactly the same as those of `SyntacticAnalyzer.generate_instructions`, and a change
+# which fails to compile leaves the compiler in its previous state, so that the next change is compared with the last
+# text that compiled
+class IncrementalCompiler(object):
+    def __init__(self, fold_constants: bool = False):
+        self.fold_constants = fold_constants
+        self.text: Optional[str] = None
+        # the declarations: where they end in the text, their instructions, and the symbol table right after them
+        self._head_end = 0
+        self._head: List[VMOperator] = []
+        self._head_text = ''
+        self._symbols: Optional[SymbolTable] = None
+        self._statements: List[_Statement] = []
+        # the stack offset of each var declared without a value => the first statement assigning it (None if none does)
+        self._first_sites: Dict[int, Optional[_Statement]] = {}
+        # what the last `update` did
+        self.incremental = False
+        self.reparsed_chars = self.reparsed_statements = 0
+    
+    @property
+    def instructions(self) -> List[VMOperator]:
+        instructions = list(self._head)
+        for st in self._statements:
+            instructions.extend(st.instructions)
+        return instructions
+    
+    def serialize(self) -> str:
+        return self._head_text + ''.join(st.text for st in self._statements)
+    
+    # returns whether it was done incrementally, raises the compilation errors
+    def update(self, full_text: str) -> bool:
+        self.incremental = self.text is not None and self._update_incrementally(full_text)
+        if not self.incremental:
+            self._rebuild(full_text)
+        return self.incremental
+    
+    def _rebuild(self, full_text: str):
+        analyzer = SyntacticAnalyzer(DFATokenizer(full_text).parse_stream(), self.fold_constants)
+        # the same as `generate_instructions`, but the statements are recorded one by one
+        if analyzer.get != TokenType.BEGIN:
+            raise SynProcessErr('"begin" missing')
+        analyzer.parse_declarations()
+        head_end = analyzer.tokens.offsets[analyzer.cur]
+        head = list(analyzer.instructions)
+        symbols = analyzer.symbols.copy()
+        statements = []
+        while analyzer.peek != TokenType.END:
+            start = len(analyzer.instructions)
+            analyzer.parse_statement()
+            statements.append(_Statement(analyzer.instructions[start:]))
+        analyzer.parse_process_end()
+        
+        self.text = full_text
+        self._head_end, self._head, self._head_text, self._symbols = head_end, head, serialize_instructions(head), symbols
+        self._statements = statements
+        self._first_sites = {offset: None for offset in symbols.uninitialized_offsets()}
+        for i, st in enumerate(statements):
+            st.index = i
+            if st.assigned in self._first_sites and self._first_sites[st.assigned] is None:
+                self._first_sites[st.assigned] = st
+        self.reparsed_chars, self.reparsed_statements = len(full_text), len(statements)
+    
+    # returns False if a full rebuild is needed
+    def _update_incrementally(self, full_text: str) -> bool:
+        old, head_end = self.text, self._head_end
+        if full_text == old:
+            self.reparsed_chars = self.reparsed_statements = 0
+            return True
+        # the changed range is [p, old_end) in the old text, and [p, new_end) in the new one
+        limit = min(len(old), len(full_text))
+        p = _common_prefix_len(old, full_text, limit)
+        s = _common_suffix_len(old, full_text, limit - p)
+        old_end = len(old) - s
+        if p < head_end:
+            return False
+        
+        # extend it to whole statements: [a, b) in the old text holds the statements [first, last)
+        i = old.rfind(';', head_end, p)
+        a = head_end if i < 0 else i + 1
+        first = old.count(';', head_end, a)
+        j = old.find(';', old_end)
+        to_end = j < 0
+        b = len(old) if to_end else j + 1
+        last = len(self._statements) if to_end else first + old.count(';', a, b)
+        region = full_text[a:b + len(full_text) - len(old)]
+        
+        analyzer = SyntacticAnalyzer(DFATokenizer(region).parse_stream(), self.fold_constants)
+        if first == 0 and analyzer.peek in {TokenType.CONST, TokenType.VAR}:
+            return False
+        # the statements cannot declare anything, so only the flags are copied
+        symbols = analyzer.symbols = self._symbols.copy()
+        for offset, site in self._first_sites.items():
+            if site is not None and site.index < first:
+                symbols.flags[offset] |= INITIALIZED
+        uninitialized_offsets = {offset for offset in self._first_sites if not symbols.flags[offset] & INITIALIZED}
+        
+        statements = []
+        while analyzer.peek != (TokenType.END if to_end else TokenType.EOF_TOKEN):
+            if analyzer.peek == TokenType.END:
+                return False
+            start = len(analyzer.instructions)
+            analyzer.parse_statement()
+            statements.append(_Statement(analyzer.instructions[start:]))
+        if to_end:
+            analyzer.parse_process_end()
+        
+        # the vars left uninitialized after these statements must not change, or the later ones need to be rechecked
+        old_assigned = {st.assigned for st in self._statements[first:last]} & uninitialized_offsets
+        if old_assigned != {st.assigned for st in statements} & uninitialized_offsets:
+            return False
+        
+        # a var still uninitialized before these statements is assigned by them if and only if its first site was among
+        # the old ones (as checked above), and then its first site is now the first of the new ones assigning it
+        new_first_sites = {}
+        for st in reversed(statements):
+            if st.assigned in uninitialized_offsets:
+                new_first_sites[st.assigned] = st
+        self._first_sites.update(new_first_sites)
+        self._statements[first:last] = statements
+        # only the positions of the new statements change, unless their number does
+        end = first + len(statements) if len(statements) == last - first else len(self._statements)
+        for i in range(first, end):
+            self._statements[i].index = i
+        self.text = full_text
+        self.reparsed_chars, self.reparsed_statements = len(region), len(statements)
+        return True
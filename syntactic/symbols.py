@@ -0,0 +1,41 @@
+from array import array
+from typing import Dict, List, Optional
+
+# the bits of `SymbolTable.flags`
+CONST, INITIALIZED = 1, 2
+
+
+# the consts and vars declared so far, in columns indexed by the stack offset (each declaration takes the next slot):
+# `offsets` maps the (interned) names to their offsets, so that a reference costs a single hash lookup, and the kind,
+# the state and the value of a const are kept in flat arrays instead of one dict entry per name for each of them
+class SymbolTable(object):
+    __slots__ = ['offsets', 'flags', 'values']
+    
+    def __init__(self):
+        self.offsets: Dict[str, int] = {}
+        self.flags = bytearray()
+        # the values of the consts (0 for the vars)
+        self.values = array('i')
+    
+    def __len__(self):
+        return len(self.flags)
+    
+    def lookup(self, name: str) -> Optional[int]:
+        return self.offsets.get(name)
+    
+    # returns the stack offset of the new symbol, the caller checks the redeclaration
+    def declare(self, name: str, const: bool, initialized: bool, value: int = 0) -> int:
+        offset = len(self.flags)
+        self.offsets[name] = offset
+        self.flags.append((CONST if const else 0) | (INITIALIZED if initialized or const else 0))
+        self.values.append(value if const else 0)
+        return offset
+    
+    def uninitialized_offsets(self) -> List[int]:
+        return [offset for offset, flags in enumerate(self.flags) if not flags & INITIALIZED]
+    
+    # the statements only change the flags, so the copy shares the names and the values
+    def copy(self) -> 'SymbolTable':
+        table = SymbolTable()
+        table.offsets, table.flags, table.values = self.offsets, bytearray(self.flags), self.values
+        return table
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+from typing import Optional, Tuple, Union
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPILER_PACKAGES = ['lexical', 'syntactic', 'vm', 'utils']
+_version: Optional[str] = None
+
+
+# the hash of the source code of the compiler itself, so that the cache is invalidated automatically once any of
+# the modules changes; it is computed once per process
+def compiler_version() -> str:
+    global _version
+    if _version is None:
+        h = hashlib.sha256(sys.version.encode())
+        paths = [os.path.join(_PROJECT_ROOT, 'miniplc0.py')]
+        for pkg in COMPILER_PACKAGES:
+            pkg_dir = os.path.join(_PROJECT_ROOT, pkg)
+            paths.extend(sorted(os.path.join(pkg_dir, f) for f in os.listdir(pkg_dir) if f.endswith('.py')))
+        for path in paths:
+            with open(path, 'rb') as fin:
+                h.update(os.path.relpath(path, _PROJECT_ROOT).encode())
+                h.update(fin.read())
+        _version = h.hexdigest()
+    return _version
+
+
+# an entry is the header (the magic, whether the output is text, the length of the error message), the error message
+# and the output, all of them plain bytes, so that reading an entry never runs any code
+_MAGIC = b'MPC0'
+_HEADER = struct.Struct('<4sBI')
+
+
+# a content-addressed on-disk cache of compilation results, keyed by the hash of the source text, the compiler version
+# and the flags, each entry is a file holding the emitted output and the error message (if any)
+# the least recently used entries (by mtime, which is refreshed on every hit) are evicted once the total size of the
+# entries exceeds `max_bytes`; the directory is scanned for the size only on the first `put` and whenever the size
+# counted since then (the entries put by this process) exceeds `max_bytes`, so the entries put by other processes
+# meanwhile are only noticed at the next scan
+class CompilationCache(object):
+    ENV_DIR = 'MINIPLC0_CACHE_DIR'
+    DEFAULT_MAX_BYTES = 256 << 20
+    
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total: Optional[int] = None
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def from_flag(cache_dir: Optional[str], max_bytes: int = DEFAULT_MAX_BYTES) -> Optional['CompilationCache']:
+        cache_dir = cache_dir or os.environ.get(CompilationCache.ENV_DIR, None)
+        return None if not cache_dir else CompilationCache(cache_dir, max_bytes)
+    
+    # the source may also be given as its utf-8 bytes (e.g. a file mapped into memory), which hash to the same key
+    def key(self, source: Union[str, bytes], **flags) -> str:
+        h = hashlib.sha256(compiler_version().encode())
+        h.update(repr(sorted(flags.items())).encode())
+        h.update(source.encode('utf-8', 'surrogatepass') if isinstance(source, str) else source)
+        return h.hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.entry')
+    
+    # returns (the output, which is either text or bytes, the error message), or None on a miss or a malformed entry
+    def get(self, key: str) -> Optional[Tuple[Union[str, bytes], str]]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fin:
+                data = fin.read()
+            magic, is_text, n = _HEADER.unpack_from(data)
+            if magic != _MAGIC:
+                return None
+            error = data[_HEADER.size:_HEADER.size + n].decode('utf-8')
+            output = data[_HEADER.size + n:]
+            if is_text:
+                output = output.decode('utf-8')
+        except (OSError, struct.error, UnicodeDecodeError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return output, error
+    
+    def put(self, key: str, output: Union[str, bytes], error: str):
+        is_text = isinstance(output, str)
+        error = error.encode('utf-8')
+        data = _HEADER.pack(_MAGIC, is_text, len(error)) + error + (output.encode('utf-8') if is_text else bytes(output))
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(data)
+            # atomic, so that concurrent compilers never see a partial entry
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        if self._total is None:
+            self.evict()
+        else:
+            self._total += len(data)
+            if self._total > self.max_bytes:
+                self.evict()
+    
+    # scan the directory, and remove the least recently used entries if they take more than `max_bytes`
+    def evict(self):
+        entries, total = [], 0
+        for e in os.scandir(self.cache_dir):
+            if e.name.endswith('.entry'):
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        self._total = total
+
+
+if __name__ == '__main__':
+    cache = CompilationCache(tempfile.mkdtemp())
+    k = cache.key('begin end', fold=False)
+    print(k, cache.get(k))
+    cache.put(k, '', '')
+    print(k, cache.get(k))
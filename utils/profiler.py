@@ -0,0 +1,76 @@
+import contextlib
+import gc
+import json
+import sys
+import time
+from typing import Dict, List, TextIO
+
+from vm.op import VM_OP_CLZ
+
+
+# the wall time and the allocations of each phase (tokenizing, parsing, emitting, loading and running the VM), together
+# with the opcode histogram of the VM, collected for `miniplc0.py --profile`
+# the allocations are counted by the interpreter itself (the net number of memory blocks allocated by the phase, and
+# the number of garbage collections it triggered), so that profiling does not slow down the phases being measured
+class Profiler(object):
+    def __init__(self):
+        self.phases: Dict[str, dict] = {}
+        # the class of an operator => [executions, seconds]
+        self._op_stats: Dict[type, List] = {}
+    
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        gc_before = sum(s['collections'] for s in gc.get_stats())
+        blocks_before = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self.phases.setdefault(name, {'seconds': 0.0, 'blocks': 0, 'collections': 0})
+            stats['seconds'] += elapsed
+            stats['blocks'] += sys.getallocatedblocks() - blocks_before
+            stats['collections'] += sum(s['collections'] for s in gc.get_stats()) - gc_before
+    
+    # the hook passed to `VM.run`, it executes the instruction and charges its time to the opcode
+    def __call__(self, vm, op):
+        start = time.perf_counter()
+        try:
+            op.exec(vm)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self._op_stats.get(type(op))
+            if stats is None:
+                stats = self._op_stats[type(op)] = [0, 0.0]
+            stats[0] += 1
+            stats[1] += elapsed
+    
+    @property
+    def opcodes(self) -> Dict[str, dict]:
+        return {
+            VM_OP_CLZ.aliases[clz]: {'count': count, 'seconds': seconds}
+            for clz, (count, seconds) in sorted(self._op_stats.items(), key=lambda kv: -kv[1][1])
+        }
+    
+    def to_dict(self) -> dict:
+        return {'phases': self.phases, 'opcodes': self.opcodes}
+    
+    def dump_json(self, path: str):
+        with open(path, 'w') as fout:
+            json.dump(self.to_dict(), fout, indent=2)
+            fout.write('\n')
+    
+    def report(self, fp: TextIO = None):
+        fp = fp or sys.stderr
+        print('\n=========== profile ===========', file=fp)
+        print(f'{"phase":12s} {"ms":>10s} {"blocks":>10s} {"gc":>4s}', file=fp)
+        for name, stats in self.phases.items():
+            print(f'{name:12s} {stats["seconds"] * 1e3:10.3f} {stats["blocks"]:10d} {stats["collections"]:4d}', file=fp)
+        
+        opcodes = self.opcodes
+        if opcodes:
+            total = sum(stats['seconds'] for stats in opcodes.values()) or 1.0
+            print(f'\n{"opcode":12s} {"count":>10s} {"ms":>10s} {"%":>6s}', file=fp)
+            for alias, stats in opcodes.items():
+                print(f'{alias:12s} {stats["count"]:10d} {stats["seconds"] * 1e3:10.3f} {stats["seconds"] / total * 100:6.1f}', file=fp)
+        print('===============================', file=fp)
@@ -1,11 +1,16 @@
 class Registry(dict):
     def __init__(self, *args, **kwargs):
         super(Registry, self).__init__(*args, **kwargs)
+        # the reverse table (registered object => its first alias), filled at registration time for O(1) lookups
+        self.aliases = {}
+        for alias, cmd_clz in self.items():
+            self.aliases.setdefault(cmd_clz, alias)
     
     @staticmethod
     def _register_generic(module_dict, cmd_clz, alias):
         assert alias not in module_dict
         module_dict[alias] = cmd_clz
+        module_dict.aliases.setdefault(cmd_clz, alias)
     
     def register(self, alias_or_cmd_clz):
         if isinstance(alias_or_cmd_clz, str):
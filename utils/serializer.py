@@ -0,0 +1,58 @@
+from typing import Iterable, List, TextIO, Union
+
+from lexical.meta import Token, TokenType
+from lexical.stream import TokenStream
+from vm.op import VMOperator, VM_OP_CLZ
+
+# the number of lines joined into a single `write`
+CHUNK_LINES = 1 << 14
+
+
+def _write_chunked(lines: Iterable[str], fp: TextIO):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_LINES:
+            chunk.append('')
+            fp.write('\n'.join(chunk))
+            chunk.clear()
+    if chunk:
+        chunk.append('')
+        fp.write('\n'.join(chunk))
+
+
+# the same text as `print(op)` line by line, but the mnemonics come from the reverse table of `VM_OP_CLZ`
+def iter_instruction_lines(instructions: Iterable[VMOperator]) -> Iterable[str]:
+    aliases = VM_OP_CLZ.aliases
+    for op in instructions:
+        operand = op.operand
+        yield aliases[type(op)] if operand is None else f'{aliases[type(op)]} {operand}'
+
+
+def serialize_instructions(instructions: Iterable[VMOperator]) -> str:
+    lines = list(iter_instruction_lines(instructions))
+    lines.append('')
+    return '\n'.join(lines) if len(lines) > 1 else ''
+
+
+def dump_instructions(instructions: Iterable[VMOperator], fp: TextIO):
+    _write_chunked(iter_instruction_lines(instructions), fp)
+
+
+# the same text as the token dump of `miniplc0.py -t`, e.g. "IDENTIFIER a", "EOF_TOKEN"
+def iter_token_lines(tokens: Union[List[Token], TokenStream]) -> Iterable[str]:
+    if isinstance(tokens, TokenStream):
+        # read the columns directly instead of materializing the `Token`s
+        names = {t.value: t.name for t in TokenType}
+        vals, no_val = tokens.vals, TokenStream.NO_VAL
+        for i in range(len(tokens)):
+            val_index = tokens.val_indices[i]
+            name = names[tokens.type_codes[i]]
+            yield name if val_index == no_val else f'{name} {vals[val_index]}'
+    else:
+        for tok in tokens:
+            yield tok.token_type.name if tok.val is None else f'{tok.token_type.name} {tok.val}'
+
+
+def dump_tokens(tokens: Union[List[Token], TokenStream], fp: TextIO):
+    _write_chunked(iter_token_lines(tokens), fp)
@@ -0,0 +1,152 @@
+import mmap
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from typing import BinaryIO, List, Sequence, Tuple
+
+from vm.err import VMBytecodeErr
+from vm.op import VMOperator, VM_OP_CLZ, VM_OP_CODE
+
+# layout of a binary .plc0 file (all little-endian):
+#   header   | magic b'PLC0' | u16 version | u16 reserved | u32 count |
+#   opcodes  | `count` bytes: the VM_OP_CODE of each instruction, with bit 7 set if it has an operand |
+#   padding  | up to a multiple of 4 bytes |
+#   operands | `count` int32s (0 for the instructions without an operand) |
+MAGIC = b'PLC0'
+VERSION = 1
+_HEADER = struct.Struct('<4sHHI')
+_HAS_OPERAND = 0x80
+
+_CLZ_TO_CODE = {VM_OP_CLZ[alias]: code for alias, code in VM_OP_CODE.items()}
+_CODE_TO_CLZ = {code: VM_OP_CLZ[alias] for alias, code in VM_OP_CODE.items()}
+# clears the operand flag of every opcode byte by a single `bytes.translate`
+_STRIP_OPERAND_FLAG = bytes(b & ~_HAS_OPERAND for b in range(256))
+
+
+def _operands_offset(count: int) -> int:
+    return (_HEADER.size + count + 3) & ~3
+
+
+def _encode(instructions: List[VMOperator]) -> Tuple[array, array]:
+    codes, operands = array('B'), array('i')
+    for op in instructions:
+        code = _CLZ_TO_CODE.get(type(op), None)
+        if code is None:
+            raise VMBytecodeErr(f'unregistered instruction "{op}"')
+        if op.operand is None:
+            codes.append(code)
+            operands.append(0)
+        elif -0x80000000 <= op.operand <= 0x7fffffff:
+            codes.append(code | _HAS_OPERAND)
+            operands.append(op.operand)
+        else:
+            raise VMBytecodeErr(f'operand out of the int32 range in "{op}"')
+    if sys.byteorder == 'big':
+        operands.byteswap()
+    return codes, operands
+
+
+def dump_bytecode(instructions: List[VMOperator], fp: BinaryIO):
+    codes, operands = _encode(instructions)
+    count = len(codes)
+    fp.write(_HEADER.pack(MAGIC, VERSION, 0, count))
+    fp.write(codes.tobytes())
+    fp.write(bytes(_operands_offset(count) - _HEADER.size - count))
+    fp.write(operands.tobytes())
+
+
+
+# writes exactly what `dump_bytecode` would write, but takes the instructions piece by piece: the opcodes go straight
+# into `fp` after the header, the operands into a temporary file which is appended to `fp` by `close`, and the count in
+# the header is filled in last (so `fp` must be seekable)
+class BytecodeWriter(object):
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+        self.count = 0
+        self._header_pos = fp.tell()
+        self._operands = tempfile.TemporaryFile()
+        fp.write(_HEADER.pack(MAGIC, VERSION, 0, 0))
+    
+    def write(self, instructions: List[VMOperator]):
+        codes, operands = _encode(instructions)
+        self.fp.write(codes.tobytes())
+        self._operands.write(operands.tobytes())
+        self.count += len(codes)
+    
+    def close(self):
+        fp, count = self.fp, self.count
+        fp.write(bytes(_operands_offset(count) - _HEADER.size - count))
+        self._operands.seek(0)
+        shutil.copyfileobj(self._operands, fp)
+        self._operands.close()
+        end = fp.tell()
+        fp.seek(self._header_pos)
+        fp.write(_HEADER.pack(MAGIC, VERSION, 0, count))
+        fp.seek(end)
+    
+    # drop the operands written so far, without finishing `fp`
+    def abort(self):
+        self._operands.close()
+
+
+def is_bytecode(path: str) -> bool:
+    with open(path, 'rb') as fin:
+        return fin.read(len(MAGIC)) == MAGIC
+
+
+# returns the opcodes (operand flags cleared) and the operands, both of which are views of the memory-mapped file
+# instead of lists of python objects, and the raw opcodes (for telling whether there is an operand)
+def load_bytecode(path: str) -> Tuple[Sequence[int], Sequence[int], Sequence[int]]:
+    with open(path, 'rb') as fin:
+        try:
+            buf = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            raise VMBytecodeErr('truncated header')
+    if len(buf) < _HEADER.size:
+        raise VMBytecodeErr('truncated header')
+    magic, version, _, count = _HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise VMBytecodeErr('bad magic number')
+    if version != VERSION:
+        raise VMBytecodeErr(f'unsupported version {version} (expected {VERSION})')
+    operands_offset = _operands_offset(count)
+    if len(buf) != operands_offset + 4 * count:
+        raise VMBytecodeErr('truncated or trailing data')
+    
+    view = memoryview(buf)
+    raw_codes = view[_HEADER.size:_HEADER.size + count]
+    codes = raw_codes.tobytes().translate(_STRIP_OPERAND_FLAG)
+    unknown_codes = set(codes).difference(_CODE_TO_CLZ)
+    if unknown_codes:
+        raise VMBytecodeErr(f'unknown opcodes {sorted(unknown_codes)}')
+    if sys.byteorder == 'big':
+        operands = array('i', view[operands_offset:])
+        operands.byteswap()
+    else:
+        operands = view[operands_offset:].cast('i')
+    return codes, operands, raw_codes
+
+
+# a read-only code segment backed by the loaded columns, the `VMOperator`s are only created when indexed
+class BytecodeSegment(Sequence):
+    def __init__(self, codes: Sequence[int], operands: Sequence[int], raw_codes: Sequence[int]):
+        self.codes, self.operands, self.raw_codes = codes, operands, raw_codes
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        clz = _CODE_TO_CLZ[self.codes[i]]
+        return clz(self.operands[i]) if self.raw_codes[i] & _HAS_OPERAND else clz()
+
+
+if __name__ == '__main__':
+    import io
+    
+    f = io.BytesIO()
+    dump_bytecode([VM_OP_CLZ['LIT'](1), VM_OP_CLZ['LIT'](-2), VM_OP_CLZ['ADD'](), VM_OP_CLZ['WRT']()], f)
+    print(f.getvalue())
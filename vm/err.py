@@ -20,3 +20,11 @@ class VMArithmeticOverflowErr(VMErr):
 
 class VMZeroDivisionErr(VMErr):
     pass
+
+
+class VMBytecodeErr(VMErr):
+    pass
+
+
+class VMVerificationErr(VMErr):
+    pass
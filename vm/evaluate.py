@@ -0,0 +1,76 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from vm.err import VMStackOverflowErr
+from vm.impl import VM
+from vm.op import VMOperator, VM_OP_CLZ
+from vm.output import ListSink
+
+_LIT, _WRT = VM_OP_CLZ['LIT'], VM_OP_CLZ['WRT']
+
+CACHE_ENTRIES = 1 << 10
+# the hash of the source, the stack size and the flags => the evaluated program
+_cache: 'OrderedDict[bytes, List[VMOperator]]' = OrderedDict()
+
+
+# the source may also be given as its utf-8 bytes, see `CompilationCache.key`
+def _key(source: Union[str, bytes], stack_size: int, flags: Optional[Dict[str, Any]]) -> bytes:
+    h = hashlib.sha256(source.encode('utf-8', 'surrogatepass') if isinstance(source, str) else source)
+    h.update(stack_size.to_bytes(8, 'little'))
+    h.update(repr(sorted((flags or {}).items())).encode())
+    return h.digest()
+
+
+# a program has no input, so what it does is known once it is compiled: run it now, and replace it with a LIT and a WRT
+# for each value it prints
+# if it stops early (with a `VMErr` or at an ILL), the stack right before the faulting instruction is rebuilt by LITs
+# and the instruction itself follows, so that it stops in exactly the same way, with the same stack
+# a stack overflow depends on the stack size of the VM which runs the program, so such a program is left as it is
+# `stack_size` is that of the VM which will run the program
+# if `source` is given, the result is memoized by its hash, together with the stack size and the `flags` which the
+# program was compiled with from the source (e.g. `fold`, `passes`, `peephole`), see `lookup`
+def evaluate_program(
+        instructions: Sequence[VMOperator], stack_size: int = VM.STACK_SIZE, source: Union[str, bytes] = None,
+        flags: Dict[str, Any] = None,
+) -> List[VMOperator]:
+    vm = VM(instructions='', stack_size=stack_size, output=ListSink())
+    vm._code_seg = list(instructions)
+    vm.step(len(instructions))
+    
+    if isinstance(vm.error, VMStackOverflowErr):
+        evaluated = list(instructions)
+    else:
+        evaluated = []
+        for val in vm.output.values:
+            evaluated.append(_LIT(val))
+            evaluated.append(_WRT())
+        if vm._ip < len(instructions) or vm.error is not None:
+            # replay till right before the faulting instruction
+            fault = vm._ip - 1
+            replay = VM(instructions='', stack_size=stack_size, output=ListSink())
+            replay._code_seg = vm._code_seg
+            replay.step(fault)
+            evaluated.extend(_LIT(val) for val in replay.stack_values())
+            evaluated.append(instructions[fault])
+    
+    if source is not None:
+        _cache[_key(source, stack_size, flags)] = evaluated
+        if len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return list(evaluated)
+
+
+# the evaluated program of the source if it has been evaluated recently with the same stack size and compiled with the
+# same flags, so that it is not even compiled again
+def lookup(source: Union[str, bytes], stack_size: int = VM.STACK_SIZE, flags: Dict[str, Any] = None) -> Optional[List[VMOperator]]:
+    key = _key(source, stack_size, flags)
+    evaluated = _cache.get(key)
+    if evaluated is None:
+        return None
+    _cache.move_to_end(key)
+    return list(evaluated)
+
+
+def clear_cache():
+    _cache.clear()
@@ -1,15 +1,44 @@
 import sys
 import traceback
-from typing import Callable
+from array import array
+from typing import Callable, List, Optional, Tuple
 
-from vm.op import VM_OP_CLZ
-from vm.err import VMAccessViolationErr, VMStackOverflowErr, VMErr, VMIllegalInstructionErr
+from vm.bytecode import BytecodeSegment, load_bytecode
+from vm.jit import JITProgram, compile_program
+from vm.op import VMOperator, VM_OP_CLZ, VM_OP_CODE
+from vm.output import NullSink, OutputSink, StreamSink
+from vm.verifier import Verification, verify
+from vm.err import VMAccessViolationErr, VMStackOverflowErr, VMErr, VMIllegalInstructionErr, VMArithmeticOverflowErr, VMZeroDivisionErr, VMVerificationErr
+
+# opcodes handled inline by `VM._run_decoded`, the others are dispatched to `VMOperator.exec`
+_GENERIC = -1
+_LIT, _LOD, _STO = VM_OP_CODE['LIT'], VM_OP_CODE['LOD'], VM_OP_CODE['STO']
+_ADD, _SUB, _MUL, _DIV = VM_OP_CODE['ADD'], VM_OP_CODE['SUB'], VM_OP_CODE['MUL'], VM_OP_CODE['DIV']
+_WRT, _NEG = VM_OP_CODE['WRT'], VM_OP_CODE['NEG']
+_ADDI, _SUBI, _MULI, _DIVI = VM_OP_CODE['ADDI'], VM_OP_CODE['SUBI'], VM_OP_CODE['MULI'], VM_OP_CODE['DIVI']
+_ADDL, _SUBL, _MULL, _DIVL = VM_OP_CODE['ADDL'], VM_OP_CODE['SUBL'], VM_OP_CODE['MULL'], VM_OP_CODE['DIVL']
+_FUSED_WITH_LOD = {_ADDL, _SUBL, _MULL, _DIVL}
+_FUSED = {_ADDI, _SUBI, _MULI, _DIVI} | _FUSED_WITH_LOD
+_CLZ_TO_CODE = {VM_OP_CLZ[alias]: code for alias, code in VM_OP_CODE.items()}
 
 
 class VM(object):
     STACK_SIZE = 1 << 10
+    # how many rows of the code and the stack around `ip` and `sp` a windowed dump shows
+    DUMP_RADIUS = 8
+    # the trace is not rebuilt (see `trace`) if the program stopped after more instructions than this
+    TRACE_REPLAY_LIMIT = 1 << 20
     
-    def __init__(self, instructions: str):
+    # `stack_size` defaults to `VM.STACK_SIZE`, and `output` (see `vm/output.py`) to a buffered sink of `sys.stdout`
+    # if `trace_size` is set, an error is reported with a windowed dump and the trace of the last `trace_size`
+    # instructions (see `trace`) instead of the whole segments
+    # if `verify` is set, the code is verified when loaded (see `verify`), and a `VMVerificationErr` is raised right away
+    # if it cannot be
+    def __init__(self, instructions: str, stack_size: int = None, output: OutputSink = None, trace_size: int = 0, verify: bool = False):
+        self.stack_size = stack_size or VM.STACK_SIZE
+        self.trace_size = trace_size
+        self.output = output or StreamSink()
+        self.write = self.output.write
         self._code_seg, self._stack_seg = [], []
         for ins in instructions.splitlines():
             ops = ins.split()
@@ -17,45 +46,380 @@ class VM(object):
                 continue
             self._code_seg.append(VM_OP_CLZ[ops[0]]() if len(ops) == 1 else VM_OP_CLZ[ops[0]](int(ops[1])))
         self._ip = 0
+        self._decoded = None
+        self._jitted = None
+        # set once the program ends (see `step`), with the `VMErr` it ended with if any
+        self.halted = False
+        self.error: Optional[VMErr] = None
+        self.verification: Optional[Verification] = None
+        if verify:
+            self.verify(strict=True)
     
-    def run(self, peep: Callable = lambda _: _):
-        for ip, op in enumerate(self._code_seg):
-            self._ip = ip + 1
+    # load a binary .plc0 file (see `vm/bytecode.py`) and execute directly from the memory-mapped buffer
+    @classmethod
+    def from_bytecode(cls, path: str, stack_size: int = None, output: OutputSink = None, trace_size: int = 0, verify: bool = False) -> 'VM':
+        codes, operands, raw_codes = load_bytecode(path)
+        vm = cls(instructions='', stack_size=stack_size, output=output, trace_size=trace_size)
+        vm._code_seg = BytecodeSegment(codes, operands, raw_codes)
+        vm._decoded = codes, operands
+        if verify:
+            vm.verify(strict=True)
+        return vm
+    
+    # prove (only once) that no instruction can touch the stack illegally or overflow it (see `vm/verifier.py`), after
+    # which the program runs without any of these checks (see `_run_unchecked`)
+    # if `strict` is set, a `VMVerificationErr` is raised with the first instruction which fails the verification
+    def verify(self, strict: bool = False) -> Verification:
+        if self.verification is None:
+            codes, operands = self._decode()
+            self.verification = verify(codes, operands, self.stack_size)
+        if strict and not self.verification.ok:
+            ip = self.verification.ip
+            raise VMVerificationErr(f'{self._code_seg[ip]}: {self.verification}')
+        return self.verification
+    
+    # without a `hook`, the code segment is decoded once and executed by a tight loop (see `_run_decoded`), or by the
+    # python function it is compiled into if `jit` is set (see `vm/jit.py`)
+    # otherwise `hook(vm, op)` is called in place of `op.exec(vm)` for each instruction, and is responsible for executing
+    # it (e.g. `utils.profiler.Profiler` times every instruction)
+    # the output is flushed before a `VMErr` is reported and when the program ends, so it always comes before the dump
+    # it runs from where `step` stopped, if the program has been stepped
+    def run(self, hook: Callable = None, jit: bool = False):
+        try:
+            if hook is None:
+                program = self.jit() if jit and self._ip == 0 and self.sp == 0 else None
+                if program is None:
+                    self._run()
+                else:
+                    program.run(self)
+            else:
+                code_seg = self._code_seg
+                for ip in range(self._ip, len(code_seg)):
+                    self._ip = ip + 1
+                    hook(self, code_seg[ip])
+        except VMIllegalInstructionErr:
+            pass
+        except VMErr as err:
+            self.error = err
+            self.output.flush()
+            self.report_error()
+        finally:
+            self.halted = True
+            self.output.flush()
+    
+    # run at most `n` more instructions, returns whether the program has ended (`_ip` tells how far it has gone, since
+    # there are no jumps), so that many programs can be interleaved (see `vm/scheduler.py`)
+    # unlike `run`, a `VMErr` is not reported but kept in `error`, see `report_error`
+    def step(self, n: int) -> bool:
+        if self.halted:
+            return True
+        try:
+            self._run(self._ip + n)
+            self.halted = self._ip >= len(self._code_seg)
+        except VMIllegalInstructionErr:
+            self.halted = True
+        except VMErr as err:
+            self.halted, self.error = True, err
+        if self.halted:
+            self.output.flush()
+        return self.halted
+    
+    # what `run` prints when the program ends with a `VMErr`: the traceback and the segments
+    def report_error(self, fp=None):
+        fp = fp or sys.stderr
+        traceback.print_exception(type(self.error), self.error, self.error.__traceback__, file=fp)
+        if self.trace_size:
+            self.render_segments(fp, radius=VM.DUMP_RADIUS)
+            self.render_trace(fp)
+        else:
+            self.render_segments(fp)
+    
+    # the last `n` instructions executed before `_ip`, as (ip, instruction, the top of the stack after it) where the
+    # top is None if the stack is empty or the instruction raised an error
+    # there are no jumps and no inputs, so instead of recording every step, it is recomputed when needed: a fresh VM
+    # runs the code at full speed till `n` instructions before, and only the last `n` are executed one by one
+    # this runs the program again up to `_ip`, so it returns None instead if `_ip` exceeds `TRACE_REPLAY_LIMIT`
+    def trace(self, n: int) -> Optional[List[Tuple[int, VMOperator, Optional[int]]]]:
+        if self._ip > self.TRACE_REPLAY_LIMIT:
+            return None
+        replay = type(self)(instructions='', stack_size=self.stack_size, output=NullSink())
+        replay._code_seg, replay._decoded = self._code_seg, self._decode()
+        start = max(self._ip - n, 0)
+        replay._run_decoded(start)
+        trace = []
+        for ip in range(start, self._ip):
+            op = self._code_seg[ip]
+            replay._ip = ip + 1
             try:
-                op.exec(self)
-                peep(self)
-            except VMIllegalInstructionErr:
-                break
-            
+                op.exec(replay)
+                top = replay[replay.sp - 1] if replay.sp else None
             except VMErr:
-                traceback.print_exc()
-                self.render_segments(sys.stderr)
-                break
+                top = None
+            trace.append((ip, op, top))
+        return trace
+    
+    # compile the code segment into a python function (only once), returns None if it cannot be compiled, or if it is
+    # not worth compiling unless `force` is set (see `compile_program`)
+    def jit(self, force: bool = False) -> Optional[JITProgram]:
+        if self._jitted is None:
+            codes, operands = self._decode()
+            self._jitted = compile_program(codes, operands, self.stack_size, force) or False
+        return self._jitted or None
+    
+    # flatten the code segment into parallel sequences of opcodes and operands
+    def _decode(self):
+        if self._decoded is None:
+            get_code = _CLZ_TO_CODE.get
+            self._decoded = (
+                [get_code(type(op), _GENERIC) for op in self._code_seg],
+                [op.operand for op in self._code_seg]
+            )
+        return self._decoded
+    
+    # the verified code is only checked for the arithmetic errors
+    def _run(self, stop: int = None):
+        if self.verification is not None and self.verification.ok:
+            self._run_unchecked(stop)
+        else:
+            self._run_decoded(stop)
+    
+    # it has exactly the same behaviors as calling `op.exec(self)` one by one (including the state of the stack and
+    # `_ip` when a `VMErr` is raised), but accesses the stack directly, and lets the `IndexError`s of popping an empty
+    # stack or accessing an offset out of range propagate to a single handler
+    # it runs from `_ip` till `stop` (or the end)
+    def _run_decoded(self, stop: int = None):
+        codes, operands = self._decode()
+        stack, stack_size, write = self._stack_seg, self.stack_size, self.write
+        push, pop = stack.append, stack.pop
+        ip = self._ip - 1
+        try:
+            for ip in range(self._ip, len(codes) if stop is None else min(stop, len(codes))):
+                code = codes[ip]
+                if code == _LIT:
+                    if len(stack) >= stack_size:
+                        raise VMStackOverflowErr
+                    push(operands[ip])
+                elif code == _LOD:
+                    offset = operands[ip]
+                    if offset < 0:
+                        raise VMAccessViolationErr
+                    val = stack[offset]
+                    if len(stack) >= stack_size:
+                        raise VMStackOverflowErr
+                    push(val)
+                elif code == _ADD:
+                    top = pop()
+                    res = pop() + top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _SUB:
+                    top = pop()
+                    res = pop() - top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _MUL:
+                    top = pop()
+                    res = pop() * top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _DIV:
+                    top, btm = pop(), pop()
+                    if top == 0:
+                        raise VMZeroDivisionErr
+                    res = btm // top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _STO:
+                    offset = operands[ip]
+                    if offset < 0:
+                        raise VMAccessViolationErr
+                    stack[offset] = stack[-1]
+                    pop()
+                elif code == _WRT:
+                    write(pop())
+                elif code == _NEG:
+                    res = -pop()
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _ADDI or code == _ADDL:
+                    top = operands[ip]
+                    if code == _ADDL:
+                        if top < 0:
+                            raise VMAccessViolationErr
+                        top = stack[top]
+                    res = pop() + top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _SUBI or code == _SUBL:
+                    top = operands[ip]
+                    if code == _SUBL:
+                        if top < 0:
+                            raise VMAccessViolationErr
+                        top = stack[top]
+                    res = pop() - top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _MULI or code == _MULL:
+                    top = operands[ip]
+                    if code == _MULL:
+                        if top < 0:
+                            raise VMAccessViolationErr
+                        top = stack[top]
+                    res = pop() * top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _DIVI or code == _DIVL:
+                    top = operands[ip]
+                    if code == _DIVL:
+                        if top < 0:
+                            raise VMAccessViolationErr
+                        top = stack[top]
+                    btm = pop()
+                    if top == 0:
+                        raise VMZeroDivisionErr
+                    res = btm // top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                else:
+                    self._code_seg[ip].exec(self)
+        except IndexError:
+            raise VMAccessViolationErr
+        finally:
+            self._ip = ip + 1
     
-    def render_segments(self, fp=sys.stdout):
+    # `_run_decoded` without the checks of the stack, for the verified code: no instruction can pop an empty stack,
+    # access an offset out of range or overflow the stack
+    def _run_unchecked(self, stop: int = None):
+        codes, operands = self._decode()
+        stack, write = self._stack_seg, self.write
+        push, pop = stack.append, stack.pop
+        ip = self._ip - 1
+        try:
+            for ip in range(self._ip, len(codes) if stop is None else min(stop, len(codes))):
+                code = codes[ip]
+                if code == _LIT:
+                    push(operands[ip])
+                elif code == _LOD:
+                    push(stack[operands[ip]])
+                elif code == _ADD:
+                    top = pop()
+                    res = pop() + top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _SUB:
+                    top = pop()
+                    res = pop() - top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _MUL:
+                    top = pop()
+                    res = pop() * top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _DIV:
+                    top, btm = pop(), pop()
+                    if top == 0:
+                        raise VMZeroDivisionErr
+                    res = btm // top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code == _STO:
+                    stack[operands[ip]] = stack[-1]
+                    pop()
+                elif code == _WRT:
+                    write(pop())
+                elif code == _NEG:
+                    res = -pop()
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                elif code in _FUSED:
+                    top = operands[ip]
+                    if code in _FUSED_WITH_LOD:
+                        top = stack[top]
+                    btm = pop()
+                    if code == _ADDI or code == _ADDL:
+                        res = btm + top
+                    elif code == _SUBI or code == _SUBL:
+                        res = btm - top
+                    elif code == _MULI or code == _MULL:
+                        res = btm * top
+                    else:
+                        if top == 0:
+                            raise VMZeroDivisionErr
+                        res = btm // top
+                    if res > 0x7fffffff or res < -0x80000000:
+                        raise VMArithmeticOverflowErr
+                    push(res)
+                else:
+                    self._code_seg[ip].exec(self)
+        finally:
+            self._ip = ip + 1
+    
+    # with a `radius`, only the top `radius` slots of the stack and the instructions within `radius` of the last one
+    # executed are shown
+    def render_segments(self, fp=None, radius: int = None):
+        # NOTE: `sys.stdout` is looked up at call time so that the dump follows any redirection
+        fp = fp or sys.stdout
         print('\n=== stack ====', file=fp)
         sp = self.sp
-        sp_fmt = f'%{len(str(sp))}d'
-        for i, val in enumerate(self._stack_seg):
-            print(f'{sp_fmt % i} | {val:8x} |', file=fp)
-        print(f'{sp} | {" " * 8} | <== sp', file=fp)
+        # the windowed dump leaves room for the '...' markers
+        width = len(str(sp)) if radius is None else max(3, len(str(sp)))
+        sp_fmt = f'%{width}d'
+        lo = 0 if radius is None else max(sp - radius, 0)
+        if lo > 0:
+            print(f'{"...":>{width}s} | ({lo} below) |', file=fp)
+        for i in range(lo, sp):
+            print(f'{sp_fmt % i} | {self._stack_seg[i]:8x} |', file=fp)
+        print(f'{sp_fmt % sp} | {" " * 8} | <== sp', file=fp)
         print('==============', file=fp)
         
         print('\n======= code =======', file=fp)
         max_ip = len(self._code_seg)
-        ip_fmt = f'%{len(str(max_ip))}d'
-        for i, op in enumerate(self._code_seg):
-            print(f'{ip_fmt % i} | {str(op):14s} | {"<== ip" if i == self._ip else ""}', file=fp)
-        print(f'{max_ip} | {" " * 14} | {"<== ip" if max_ip == self._ip else ""}', file=fp)
+        width = len(str(max_ip)) if radius is None else max(3, len(str(max_ip)))
+        ip_fmt = f'%{width}d'
+        lo, hi = (0, max_ip) if radius is None else (max(self._ip - 1 - radius, 0), min(self._ip + radius, max_ip))
+        if lo > 0:
+            print(f'{"...":>{width}s} | ({lo} above) |', file=fp)
+        for i in range(lo, hi):
+            print(f'{ip_fmt % i} | {str(self._code_seg[i]):14s} | {"<== ip" if i == self._ip else ""}', file=fp)
+        if hi < max_ip:
+            print(f'{"...":>{width}s} | ({max_ip - hi} below) |', file=fp)
+        print(f'{ip_fmt % max_ip} | {" " * 14} | {"<== ip" if max_ip == self._ip else ""}', file=fp)
         print('====================', file=fp)
     
+    def render_trace(self, fp=None, n: int = None):
+        fp = fp or sys.stdout
+        trace = self.trace(self.trace_size if n is None else n)
+        if trace is None:
+            print(f'\n======= trace (not rebuilt, {self._ip} instructions executed, over {self.TRACE_REPLAY_LIMIT}) =======', file=fp)
+            return
+        print(f'\n======= trace (last {len(trace)}) =======', file=fp)
+        ip_fmt = f'%{len(str(self._ip))}d'
+        for ip, op, top in trace:
+            print(f'{ip_fmt % ip} | {str(op):14s} | {"" if top is None else f"{top:8x}"}', file=fp)
+        print('================================', file=fp)
+    
     # interfaces
     @property
     def sp(self):
         return len(self._stack_seg)
     
     def push(self, val):
-        if len(self._stack_seg) >= VM.STACK_SIZE:
+        if len(self._stack_seg) >= self.stack_size:
             raise VMStackOverflowErr
         self._stack_seg.append(val)
     
@@ -90,10 +454,242 @@ class VM(object):
         except IndexError:
             raise VMAccessViolationErr
     
-    @staticmethod
-    def write(*args, **kwargs):
-        kwargs.update(dict(file=sys.stdout))
-        print(*args, **kwargs)
+    # the values on the stack from the bottom
+    def stack_values(self) -> List[int]:
+        return list(self._stack_seg)
+    
+    # replace the whole stack, for the backends which do not run on the stack segment itself (see `vm/jit.py`)
+    def _load_stack(self, values: List[int]):
+        self._stack_seg[:] = values
+
+
+
+# the same VM, but the stack segment is a preallocated `array('i')` of `stack_size` 32-bit ints with an explicit `sp`
+# register, which takes 4 bytes per slot (instead of a pointer plus a boxed int) and never grows
+# the errors are checked by comparing with `sp` instead of catching `IndexError`s, and the 32-bit range of the results
+# is checked by the array itself when storing them (raising an `OverflowError` only when it overflows)
+# NOTE: as the only difference, a LIT whose operand does not fit in 32 bits (which is never emitted by the compiler nor
+#       representable in bytecode) raises a `VMArithmeticOverflowErr`
+class Int32VM(VM):
+    def __init__(self, instructions: str, stack_size: int = None, output: OutputSink = None, trace_size: int = 0, verify: bool = False):
+        super(Int32VM, self).__init__(instructions, stack_size, output, trace_size, verify)
+        self._stack_seg = array('i', bytes(4 * self.stack_size))
+        self._sp = 0
+    
+    # the results of the generated code are not limited to 32 bits until stored
+    def jit(self, force: bool = False) -> Optional[JITProgram]:
+        if self._jitted is None:
+            codes, operands = self._decode()
+            if any(code == _LIT and not -0x80000000 <= operand <= 0x7fffffff for code, operand in zip(codes, operands)):
+                self._jitted = False
+        return super(Int32VM, self).jit(force)
+    
+    def _run_decoded(self, stop: int = None):
+        codes, operands = self._decode()
+        stack, stack_size, write = self._stack_seg, self.stack_size, self.write
+        sp = self._sp
+        ip = self._ip - 1
+        code = None
+        try:
+            for ip in range(self._ip, len(codes) if stop is None else min(stop, len(codes))):
+                code = codes[ip]
+                if code == _LIT:
+                    if sp >= stack_size:
+                        raise VMStackOverflowErr
+                    stack[sp] = operands[ip]
+                    sp += 1
+                elif code == _LOD:
+                    offset = operands[ip]
+                    if not 0 <= offset < sp or sp >= stack_size:
+                        raise VMAccessViolationErr if not 0 <= offset < sp else VMStackOverflowErr
+                    stack[sp] = stack[offset]
+                    sp += 1
+                elif code == _ADD:
+                    if sp < 2:
+                        sp = 0
+                        raise VMAccessViolationErr
+                    sp -= 1
+                    stack[sp - 1] += stack[sp]
+                elif code == _MUL:
+                    if sp < 2:
+                        sp = 0
+                        raise VMAccessViolationErr
+                    sp -= 1
+                    stack[sp - 1] *= stack[sp]
+                elif code == _STO:
+                    offset = operands[ip]
+                    if sp == 0 or not 0 <= offset < sp:
+                        raise VMAccessViolationErr
+                    sp -= 1
+                    stack[offset] = stack[sp]
+                elif code == _SUB:
+                    if sp < 2:
+                        sp = 0
+                        raise VMAccessViolationErr
+                    sp -= 1
+                    stack[sp - 1] -= stack[sp]
+                elif code == _DIV:
+                    if sp < 2:
+                        sp = 0
+                        raise VMAccessViolationErr
+                    sp -= 1
+                    top = stack[sp]
+                    if top == 0:
+                        sp -= 1
+                        raise VMZeroDivisionErr
+                    stack[sp - 1] //= top
+                elif code == _WRT:
+                    if sp == 0:
+                        raise VMAccessViolationErr
+                    sp -= 1
+                    write(stack[sp])
+                elif code == _NEG:
+                    if sp == 0:
+                        raise VMAccessViolationErr
+                    stack[sp - 1] = -stack[sp - 1]
+                elif code in _FUSED:
+                    top = operands[ip]
+                    if code in _FUSED_WITH_LOD:
+                        if not 0 <= top < sp:
+                            raise VMAccessViolationErr
+                        top = stack[top]
+                    elif sp == 0:
+                        raise VMAccessViolationErr
+                    if code == _ADDI or code == _ADDL:
+                        stack[sp - 1] += top
+                    elif code == _SUBI or code == _SUBL:
+                        stack[sp - 1] -= top
+                    elif code == _MULI or code == _MULL:
+                        stack[sp - 1] *= top
+                    else:
+                        if top == 0:
+                            sp -= 1
+                            raise VMZeroDivisionErr
+                        stack[sp - 1] //= top
+                else:
+                    self._sp = sp
+                    self._code_seg[ip].exec(self)
+                    sp = self._sp
+        except OverflowError:
+            # the result is stored in place of the lower operand, which has been popped as well when the error is raised
+            if code != _LIT:
+                sp -= 1
+            raise VMArithmeticOverflowErr
+        finally:
+            self._ip = ip + 1
+            self._sp = sp
+    
+    def _run_unchecked(self, stop: int = None):
+        codes, operands = self._decode()
+        stack, write = self._stack_seg, self.write
+        sp = self._sp
+        ip = self._ip - 1
+        code = None
+        try:
+            for ip in range(self._ip, len(codes) if stop is None else min(stop, len(codes))):
+                code = codes[ip]
+                if code == _LIT:
+                    stack[sp] = operands[ip]
+                    sp += 1
+                elif code == _LOD:
+                    stack[sp] = stack[operands[ip]]
+                    sp += 1
+                elif code == _ADD:
+                    sp -= 1
+                    stack[sp - 1] += stack[sp]
+                elif code == _MUL:
+                    sp -= 1
+                    stack[sp - 1] *= stack[sp]
+                elif code == _STO:
+                    sp -= 1
+                    stack[operands[ip]] = stack[sp]
+                elif code == _SUB:
+                    sp -= 1
+                    stack[sp - 1] -= stack[sp]
+                elif code == _DIV:
+                    sp -= 1
+                    top = stack[sp]
+                    if top == 0:
+                        sp -= 1
+                        raise VMZeroDivisionErr
+                    stack[sp - 1] //= top
+                elif code == _WRT:
+                    sp -= 1
+                    write(stack[sp])
+                elif code == _NEG:
+                    stack[sp - 1] = -stack[sp - 1]
+                elif code in _FUSED:
+                    top = operands[ip]
+                    if code in _FUSED_WITH_LOD:
+                        top = stack[top]
+                    if code == _ADDI or code == _ADDL:
+                        stack[sp - 1] += top
+                    elif code == _SUBI or code == _SUBL:
+                        stack[sp - 1] -= top
+                    elif code == _MULI or code == _MULL:
+                        stack[sp - 1] *= top
+                    else:
+                        if top == 0:
+                            sp -= 1
+                            raise VMZeroDivisionErr
+                        stack[sp - 1] //= top
+                else:
+                    self._sp = sp
+                    self._code_seg[ip].exec(self)
+                    sp = self._sp
+        except OverflowError:
+            if code != _LIT:
+                sp -= 1
+            raise VMArithmeticOverflowErr
+        finally:
+            self._ip = ip + 1
+            self._sp = sp
+    
+    # interfaces
+    @property
+    def sp(self):
+        return self._sp
+    
+    def push(self, val):
+        sp = self._sp
+        if sp >= self.stack_size:
+            raise VMStackOverflowErr
+        try:
+            self._stack_seg[sp] = val
+        except OverflowError:
+            raise VMArithmeticOverflowErr
+        self._sp = sp + 1
+    
+    def top(self):
+        if self._sp == 0:
+            raise VMAccessViolationErr
+        return self._stack_seg[self._sp - 1]
+    
+    def pop(self):
+        if self._sp == 0:
+            raise VMAccessViolationErr
+        self._sp -= 1
+        return self._stack_seg[self._sp]
+    
+    def __getitem__(self, offset):
+        if not 0 <= offset < self._sp:
+            raise VMAccessViolationErr
+        return self._stack_seg[offset]
+    
+    def __setitem__(self, offset, val):
+        if not 0 <= offset < self._sp:
+            raise VMAccessViolationErr
+        try:
+            self._stack_seg[offset] = val
+        except OverflowError:
+            raise VMArithmeticOverflowErr
+    
+    def stack_values(self) -> List[int]:
+        return self._stack_seg[:self._sp].tolist()
+    
+    def _load_stack(self, values: List[int]):
+        self._stack_seg[:len(values)] = array('i', values)
+        self._sp = len(values)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,193 @@
+import hashlib
+from array import array
+from collections import OrderedDict
+from functools import partial
+from operator import is_not
+from types import CodeType, FunctionType
+from typing import List, Optional, Sequence, Tuple
+
+from vm.op import VMOperator, VM_OP_CLZ, VM_OP_CODE
+from vm.err import VMErr, VMAccessViolationErr, VMStackOverflowErr, VMIllegalInstructionErr, VMArithmeticOverflowErr, VMZeroDivisionErr
+
+_ILL, _LIT, _LOD, _STO, _WRT, _NEG = (VM_OP_CODE[alias] for alias in ['ILL', 'LIT', 'LOD', 'STO', 'WRT', 'NEG'])
+# opcode => the python operator
+_BINARY = {VM_OP_CODE[alias]: sym for alias, sym in [('ADD', '+'), ('SUB', '-'), ('MUL', '*'), ('DIV', '//')]}
+_IMMEDIATE = {VM_OP_CODE[alias]: sym for alias, sym in [('ADDI', '+'), ('SUBI', '-'), ('MULI', '*'), ('DIVI', '//')]}
+_LOADED = {VM_OP_CODE[alias]: sym for alias, sym in [('ADDL', '+'), ('SUBL', '-'), ('MULL', '*'), ('DIVL', '//')]}
+_CLZ_TO_CODE = {VM_OP_CLZ[alias]: code for alias, code in VM_OP_CODE.items()}
+_has_operand = partial(is_not, None)
+
+_ERRORS = [VMIllegalInstructionErr, VMAccessViolationErr, VMStackOverflowErr]
+# the python errors raised by the generated code in place of the VM errors
+_RUNTIME_ERRORS = {IndexError: VMArithmeticOverflowErr, ZeroDivisionError: VMZeroDivisionErr}
+
+CACHE_ENTRIES = 32
+# compiling costs about a hundred runs of `VM._run_decoded` (the code runs each instruction exactly once), so it only
+# pays off for a program run again and again in the same process; a program not compiled yet is compiled only if it
+# has at most this many instructions, so that the delay goes unnoticed
+MAX_UNCACHED_INSTRUCTIONS = 1024
+# the fingerprint of the code => (the code object, the line table)
+_cache: 'OrderedDict[bytes, Tuple[CodeType, List[Tuple[int, int]]]]' = OrderedDict()
+
+
+# a program compiled into one python function, see `_generate`
+class JITProgram(object):
+    def __init__(self, code: CodeType, lines: List[Tuple[int, int]], length: int):
+        self.code = code
+        self.lines = lines
+        self.length = length
+        self._func = FunctionType(code, {clz.__name__: clz for clz in _ERRORS})
+    
+    # runs on `vm` (whose stack must be empty) and leaves it in exactly the same state as `vm.run()` would, including
+    # the stack and `_ip` when a `VMErr` is raised
+    def run(self, vm):
+        try:
+            vm._load_stack(self._func(vm.write))
+            vm._ip = self.length
+        except (VMErr, IndexError, ZeroDivisionError) as err:
+            tb = err.__traceback__
+            while tb.tb_next is not None:
+                tb = tb.tb_next
+            if tb.tb_frame.f_code is not self.code:
+                raise
+            # the values still on the stack are the first `sp` slots, which are the locals of the generated function
+            ip, sp = self.lines[tb.tb_lineno]
+            slots = tb.tb_frame.f_locals
+            vm._load_stack([slots[f's{i}'] for i in range(sp)])
+            vm._ip = ip + 1
+            del tb, slots
+            if not isinstance(err, VMErr):
+                raise _RUNTIME_ERRORS[type(err)] from None
+            raise type(err) from None
+
+
+# generate the source of a function `_program(write)` that runs the straight-line code with every stack slot kept in a
+# local variable `s<i>`, and returns the final stack
+# the stack depth before each instruction is known statically since there are no jumps, so popping an empty stack,
+# accessing an offset out of range and overflowing the stack are resolved here: the code simply stops with the error
+# at the first such instruction
+# only the arithmetic errors happen at runtime, they are detected without any branches (which makes the code much
+# cheaper to compile): the division by zero raises a `ZeroDivisionError` by itself, and `(0,)[res >> 31]` raises an
+# `IndexError` unless `res` fits in 32 bits
+# each instruction takes one line, `lines[lineno]` is the (ip, sp) to restore if the line raises an error
+# returns None if the code contains an instruction this backend does not know
+def _generate(codes: Sequence[int], operands: Sequence[Optional[int]], stack_size: int) -> Optional[Tuple[str, List[Tuple[int, int]]]]:
+    src, lines = ['def _program(write):'], [(-1, 0), (-1, 0)]
+    
+    def emit(ip: int, sp: int, line: str):
+        src.append(line)
+        lines.append((ip, sp))
+    
+    sp = 0
+    for ip in range(len(codes)):
+        code, operand = codes[ip], operands[ip]
+        if code == _LIT:
+            if sp >= stack_size:
+                emit(ip, sp, 'raise VMStackOverflowErr')
+                break
+            emit(ip, sp, f's{sp} = {operand!r}')
+            sp += 1
+        elif code == _LOD:
+            if not 0 <= operand < sp:
+                emit(ip, sp, 'raise VMAccessViolationErr')
+                break
+            if sp >= stack_size:
+                emit(ip, sp, 'raise VMStackOverflowErr')
+                break
+            emit(ip, sp, f's{sp} = s{operand}')
+            sp += 1
+        elif code == _STO:
+            if sp == 0 or not 0 <= operand < sp:
+                emit(ip, sp, 'raise VMAccessViolationErr')
+                break
+            sp -= 1
+            if operand != sp:
+                emit(ip, sp, f's{operand} = s{sp}')
+        elif code in _BINARY:
+            if sp < 2:
+                # the top is popped before popping from the empty stack
+                emit(ip, 0, 'raise VMAccessViolationErr')
+                break
+            sp -= 2
+            emit(ip, sp, f's{sp} = s{sp} {_BINARY[code]} s{sp + 1}; (0,)[s{sp} >> 31]')
+            sp += 1
+        elif code == _WRT:
+            if sp == 0:
+                emit(ip, sp, 'raise VMAccessViolationErr')
+                break
+            sp -= 1
+            emit(ip, sp, f'write(s{sp})')
+        elif code == _NEG or code in _IMMEDIATE:
+            if sp == 0:
+                emit(ip, sp, 'raise VMAccessViolationErr')
+                break
+            sp -= 1
+            rhs = f'-s{sp}' if code == _NEG else f's{sp} {_IMMEDIATE[code]} {operand!r}'
+            emit(ip, sp, f's{sp} = {rhs}; (0,)[s{sp} >> 31]')
+            sp += 1
+        elif code in _LOADED:
+            if not 0 <= operand < sp:
+                emit(ip, sp, 'raise VMAccessViolationErr')
+                break
+            sp -= 1
+            emit(ip, sp, f's{sp} = s{sp} {_LOADED[code]} s{operand}; (0,)[s{sp} >> 31]')
+            sp += 1
+        elif code == _ILL:
+            emit(ip, sp, 'raise VMIllegalInstructionErr')
+            break
+        else:
+            return None
+    else:
+        emit(len(codes), sp, f'return [{", ".join(f"s{i}" for i in range(sp))}]')
+    return '\n    '.join(src) + '\n', lines
+
+
+def _compile(source: str) -> CodeType:
+    return next(c for c in compile(source, '<miniplc0-jit>', 'exec').co_consts if isinstance(c, CodeType))
+
+
+# the hash of the opcodes, the operands and the stack size, which is all the generated code depends on
+# the columns loaded from bytecode are hashed in place; the operands of the decoded lists are packed into an array
+# without the Nones (the opcodes tell which instructions have one), which is much cheaper than running the program
+def _fingerprint(codes: Sequence[int], operands: Sequence[Optional[int]], stack_size: int) -> bytes:
+    h = hashlib.blake2b(repr((stack_size, len(codes), type(operands).__name__)).encode())
+    try:
+        h.update(codes if isinstance(codes, bytes) else bytes(codes))
+        h.update(array('q', filter(_has_operand, operands)) if isinstance(operands, list) else operands)
+    except (ValueError, OverflowError):
+        # an unknown opcode, or a LIT out of 64 bits
+        h.update(repr((list(codes), list(operands))).encode())
+    return h.digest()
+
+
+# compile the decoded code segment (see `VM._decode`) of a program, returns None if it contains an instruction this
+# backend does not know, or if it has not been compiled yet and is too long to be worth it (see
+# `MAX_UNCACHED_INSTRUCTIONS`) unless `force` is set
+# the python compiler is by far the slowest part, so the recently compiled programs are kept in memory by their
+# fingerprints, and the code is generated and compiled only on a miss
+def compile_program(codes: Sequence[int], operands: Sequence[Optional[int]], stack_size: int, force: bool = False) -> Optional[JITProgram]:
+    key = _fingerprint(codes, operands, stack_size)
+    compiled = _cache.get(key)
+    if compiled is None:
+        if not force and len(codes) > MAX_UNCACHED_INSTRUCTIONS:
+            return None
+        generated = _generate(codes, operands, stack_size)
+        if generated is None:
+            return None
+        source, lines = generated
+        compiled = _compile(source), lines
+        _cache[key] = compiled
+        if len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return JITProgram(*compiled, len(codes))
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def compile_instructions(instructions: List[VMOperator], stack_size: int, force: bool = False) -> Optional[JITProgram]:
+    get_code = _CLZ_TO_CODE.get
+    return compile_program([get_code(type(op), -1) for op in instructions], [op.operand for op in instructions], stack_size, force)
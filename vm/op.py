@@ -1,3 +1,4 @@
+import operator
 from abc import ABCMeta, abstractmethod
 
 from utils.registry import Registry
@@ -5,7 +6,7 @@ from vm.err import VMIllegalInstructionErr, VMArithmeticOverflowErr, VMZeroDivis
 
 VM_OP_CLZ = Registry()
 
-__all__ = ['VMOperator', 'VM_OP_CLZ']
+__all__ = ['VMOperator', 'VM_OP_CLZ', 'VM_OP_CODE']
 
 
 class VMOperator(metaclass=ABCMeta):
@@ -20,7 +21,7 @@ class VMOperator(metaclass=ABCMeta):
     
     @classmethod
     def get_clz_repr(cls):
-        return [k for k, v in VM_OP_CLZ.items() if v == cls][0]
+        return VM_OP_CLZ.aliases[cls]
     
     @abstractmethod
     def exec(self, vm):
@@ -58,28 +59,28 @@ class _Store(VMOperator):
 class _Add(VMOperator):
     def exec(self, vm):
         top, btm = vm.pop(), vm.pop()
-        vm.push(_calc(btm, '+', top))
+        vm.push(calc(btm, '+', top))
 
 
 @VM_OP_CLZ.register('SUB')
 class _Subtract(VMOperator):
     def exec(self, vm):
         top, btm = vm.pop(), vm.pop()
-        vm.push(_calc(btm, '-', top))
+        vm.push(calc(btm, '-', top))
 
 
 @VM_OP_CLZ.register('MUL')
 class _Multiply(VMOperator):
     def exec(self, vm):
         top, btm = vm.pop(), vm.pop()
-        vm.push(_calc(btm, '*', top))
+        vm.push(calc(btm, '*', top))
 
 
 @VM_OP_CLZ.register('DIV')
 class _Divide(VMOperator):
     def exec(self, vm):
         top, btm = vm.pop(), vm.pop()
-        vm.push(_calc(btm, '//', top))
+        vm.push(calc(btm, '//', top))
 
 
 @VM_OP_CLZ.register('WRT')
@@ -88,9 +89,86 @@ class _Write(VMOperator):
         vm.write(vm.pop())
 
 
-def _calc(lhs, op, rhs):
+# superinstructions (see `vm/peephole.py`), each of them does exactly what the sequence it replaces does
+# NEG     == LIT -1; MUL
+@VM_OP_CLZ.register('NEG')
+class _Negate(VMOperator):
+    def exec(self, vm):
+        vm.push(calc(vm.pop(), '*', -1))
+
+
+# ADDI k  == LIT k; ADD
+@VM_OP_CLZ.register('ADDI')
+class _AddImmediate(VMOperator):
+    def exec(self, vm):
+        vm.push(calc(vm.pop(), '+', self.operand))
+
+
+# SUBI k  == LIT k; SUB
+@VM_OP_CLZ.register('SUBI')
+class _SubtractImmediate(VMOperator):
+    def exec(self, vm):
+        vm.push(calc(vm.pop(), '-', self.operand))
+
+
+# MULI k  == LIT k; MUL
+@VM_OP_CLZ.register('MULI')
+class _MultiplyImmediate(VMOperator):
+    def exec(self, vm):
+        vm.push(calc(vm.pop(), '*', self.operand))
+
+
+# DIVI k  == LIT k; DIV
+@VM_OP_CLZ.register('DIVI')
+class _DivideImmediate(VMOperator):
+    def exec(self, vm):
+        vm.push(calc(vm.pop(), '//', self.operand))
+
+
+# ADDL a  == LOD a; ADD
+@VM_OP_CLZ.register('ADDL')
+class _AddLoaded(VMOperator):
+    def exec(self, vm):
+        top = vm[self.operand]
+        vm.push(calc(vm.pop(), '+', top))
+
+
+# SUBL a  == LOD a; SUB
+@VM_OP_CLZ.register('SUBL')
+class _SubtractLoaded(VMOperator):
+    def exec(self, vm):
+        top = vm[self.operand]
+        vm.push(calc(vm.pop(), '-', top))
+
+
+# MULL a  == LOD a; MUL
+@VM_OP_CLZ.register('MULL')
+class _MultiplyLoaded(VMOperator):
+    def exec(self, vm):
+        top = vm[self.operand]
+        vm.push(calc(vm.pop(), '*', top))
+
+
+# DIVL a  == LOD a; DIV
+@VM_OP_CLZ.register('DIVL')
+class _DivideLoaded(VMOperator):
+    def exec(self, vm):
+        top = vm[self.operand]
+        vm.push(calc(vm.pop(), '//', top))
+
+
+# numeric opcodes in the order of registration (used by the decoded execution loop of the VM)
+VM_OP_CODE = {alias: code for code, alias in enumerate(VM_OP_CLZ.keys())}
+
+
+_BINARY_OPERATORS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '//': operator.floordiv}
+
+
+# the result of `lhs op rhs` (`op` in `_BINARY_OPERATORS`) as the VM computes it, raising the same errors; also used to
+# fold constants at compile time
+def calc(lhs, op, rhs):
     try:
-        res = eval(f'{lhs}{op}{rhs}')
+        res = _BINARY_OPERATORS[op](lhs, rhs)
     except ZeroDivisionError:
         raise VMZeroDivisionErr
     if res > 0x7fffffff or res < -0x80000000:
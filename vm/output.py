@@ -0,0 +1,88 @@
+import sys
+from abc import ABCMeta, abstractmethod
+from typing import List, TextIO
+
+
+# where the values written by `WRT` go: the VM calls `write(val)` for each of them, and `flush()` when the program ends
+# or right before a `VMErr` is reported
+# NOTE: since `write` is called once per `WRT`, a sink may shadow it with a faster callable in `__init__`, but it still
+#       has to define the method
+class OutputSink(metaclass=ABCMeta):
+    @abstractmethod
+    def write(self, val: int):
+        pass
+    
+    def flush(self):
+        pass
+
+
+# drops the output
+class NullSink(OutputSink):
+    def write(self, val: int):
+        pass
+
+
+# buffers the values and writes them to a text stream (one per line) when `buffer_size` values are pending, or on
+# `flush`; a `buffer_size` of 0 writes every value right away
+# NOTE: if `fp` is not given, `sys.stdout` is looked up at flush time so that the output follows any redirection
+class StreamSink(OutputSink):
+    BUFFER_SIZE = 1 << 13
+    
+    def __init__(self, fp: TextIO = None, buffer_size: int = BUFFER_SIZE):
+        self.fp = fp
+        self.buffer_size = max(buffer_size, 1)
+        self._pending: List[str] = []
+        append, pending, limit = self._pending.append, self._pending, self.buffer_size
+        
+        # a closure rather than a method, since it is called once per `WRT`
+        def write(val: int):
+            append(f'{val}\n')
+            if len(pending) >= limit:
+                self.flush()
+        
+        self.write = write
+    
+    def write(self, val: int):
+        self._pending.append(f'{val}\n')
+        if len(self._pending) >= self.buffer_size:
+            self.flush()
+    
+    def flush(self):
+        fp = self.fp or sys.stdout
+        if self._pending:
+            fp.write(''.join(self._pending))
+            self._pending.clear()
+        fp.flush()
+
+
+# collects the values into `values` instead of printing them, for embedding the VM
+class ListSink(OutputSink):
+    def __init__(self):
+        self.values: List[int] = []
+        self.write = self.values.append
+    
+    def write(self, val: int):
+        self.values.append(val)
+    
+    def getvalue(self) -> str:
+        return ''.join(f'{val}\n' for val in self.values)
+
+
+# collects exactly the bytes that `StreamSink` would print
+class BytesSink(OutputSink):
+    def __init__(self):
+        self._buf = bytearray()
+        self._pending: List[int] = []
+        self.write = self._pending.append
+    
+    def write(self, val: int):
+        self._pending.append(val)
+    
+    def flush(self):
+        if self._pending:
+            self._buf += ''.join(f'{val}\n' for val in self._pending).encode()
+            self._pending.clear()
+    
+    def getvalue(self) -> bytes:
+        self.flush()
+        return bytes(self._buf)
@@ -0,0 +1,291 @@
+import heapq
+import sys
+import time
+from typing import Dict, List, Sequence, Set, TextIO, Tuple
+
+from utils.registry import Registry
+from vm.err import VMErr
+from vm.impl import VM
+from vm.op import VMOperator, VM_OP_CLZ, calc
+
+VM_PASS = Registry()
+
+_LIT, _LOD, _STO, _WRT, _NEG = (VM_OP_CLZ[alias] for alias in ['LIT', 'LOD', 'STO', 'WRT', 'NEG'])
+# class => the python operator
+_BINARY = {VM_OP_CLZ[alias]: sym for alias, sym in [('ADD', '+'), ('SUB', '-'), ('MUL', '*'), ('DIV', '//')]}
+_IMMEDIATE = {VM_OP_CLZ[alias + 'I']: sym for alias, sym in [('ADD', '+'), ('SUB', '-'), ('MUL', '*'), ('DIV', '//')]}
+_LOADED = {VM_OP_CLZ[alias + 'L']: sym for alias, sym in [('ADD', '+'), ('SUB', '-'), ('MUL', '*'), ('DIV', '//')]}
+
+
+# the straight-line code simulated once:
+#   `depths[i]` is the stack depth before the i-th instruction
+#   `consumed[i]` is where the expression whose value is popped by the i-th instruction (a STO or a WRT) starts
+#   `slots[p]` is [start, end] of the expression which pushes the p-th value left on the stack at the end, i.e. the
+#   slot of a const or a var (it is never popped after `end`, so only the references after `end` refer to it)
+# `ok` is False if the code may touch the stack illegally or overflow a stack of `stack_size` (see `vm/peephole.py`),
+# and the passes leave such code as it is
+class _Flow(object):
+    def __init__(self, instructions: Sequence[VMOperator], stack_size: int = VM.STACK_SIZE):
+        self.ok = False
+        self.depths: List[int] = []
+        self.consumed: Dict[int, int] = {}
+        self.slots: List[List[int]] = []
+        self.peak = 0
+        
+        values = []
+        for i, op in enumerate(instructions):
+            clz, sp = type(op), len(values)
+            self.depths.append(sp)
+            if clz is _LIT:
+                if not -0x80000000 <= op.operand <= 0x7fffffff:
+                    return
+                values.append([i, i])
+            elif clz is _LOD:
+                if not 0 <= op.operand < sp:
+                    return
+                values.append([i, i])
+            elif clz is _STO or clz is _WRT:
+                if sp == 0 or (clz is _STO and not 0 <= op.operand < sp):
+                    return
+                self.consumed[i] = values.pop()[0]
+            elif clz in _BINARY:
+                if sp < 2:
+                    return
+                values.pop()
+                values[-1][1] = i
+            elif clz is _NEG or clz in _IMMEDIATE or clz in _LOADED:
+                if sp == 0 or (clz in _LOADED and not 0 <= op.operand < sp):
+                    return
+                values[-1][1] = i
+            else:
+                return
+            if len(values) > stack_size:
+                return
+            self.peak = max(self.peak, len(values))
+        self.slots = values
+        self.ok = True
+    
+    # the slot read or written by the i-th instruction, None if it is not a reference to a slot
+    def referenced(self, instructions: Sequence[VMOperator], i: int):
+        op = instructions[i]
+        clz = type(op)
+        if clz is _LOD or clz is _STO or clz in _LOADED:
+            p = op.operand
+            if p < len(self.slots) and i > self.slots[p][1]:
+                return p
+        return None
+
+
+def _reads(op: VMOperator) -> bool:
+    clz = type(op)
+    return clz is _LOD or clz in _LOADED
+
+
+# whether the instructions [start, end] (which push exactly one value) can be dropped without losing an error: they
+# must not write anything, and every arithmetic operation must be on known values which do not overflow
+def _cannot_fault(instructions: Sequence[VMOperator], start: int, end: int) -> bool:
+    values = []
+    for op in instructions[start:end + 1]:
+        clz = type(op)
+        if clz is _LIT:
+            values.append(op.operand)
+        elif clz is _LOD:
+            values.append(None)
+        elif clz in _BINARY or clz is _NEG or clz in _IMMEDIATE:
+            if clz in _BINARY:
+                rhs, sym = values.pop(), _BINARY[clz]
+            else:
+                rhs, sym = (-1, '*') if clz is _NEG else (op.operand, _IMMEDIATE[clz])
+            lhs = values.pop()
+            if lhs is None or rhs is None:
+                return False
+            try:
+                values.append(calc(lhs, sym, rhs))
+            except VMErr:
+                return False
+        else:
+            return False
+    return True
+
+
+# rebuild the code without the instructions in `removed`, where:
+#   the STOs in `popped` store the value into itself, which simply pops it
+#   the slots in `dropped` are no longer pushed (their expressions must be in `removed`), so the offsets above them
+#   move down once they would have been pushed
+#   the references to each slot in `renamed` go to the slot it is mapped to
+def _rewrite(instructions: Sequence[VMOperator], flow: _Flow, removed: Set[int], popped: Set[int] = (), dropped: Set[int] = (), renamed: Dict[int, int] = None) -> List[VMOperator]:
+    renamed = renamed or {}
+    events = sorted((flow.slots[p][1], p) for p in dropped)
+    active, below, e = [], None, 0
+    
+    rewritten = []
+    for k, op in enumerate(instructions):
+        while e < len(events) and events[e][0] < k:
+            active.append(events[e][1])
+            e += 1
+            below = None
+        if k in removed:
+            continue
+        clz = type(op)
+        if k in popped:
+            op = _STO(flow.depths[k] - 1)
+        if clz is _LOD or clz is _STO or clz in _LOADED:
+            q = op.operand
+            if q in renamed and k > flow.slots[q][1]:
+                q = renamed[q]
+            if active:
+                if below is None:
+                    # below[q] = the number of dropped slots under q
+                    below = [0] * (flow.peak + 1)
+                    for p in active:
+                        below[p + 1] += 1
+                    for i in range(1, len(below)):
+                        below[i] += below[i - 1]
+                q -= below[q]
+            if q != op.operand:
+                op = clz(q)
+        rewritten.append(op)
+    return rewritten
+
+
+# remove the stores which are overwritten or never read afterwards, together with the expressions computing their
+# values if those cannot fail, otherwise only the store is dropped (the value is popped by storing it into itself)
+@VM_PASS.register('dead-stores')
+def eliminate_dead_stores(instructions: List[VMOperator], stack_size: int = VM.STACK_SIZE) -> List[VMOperator]:
+    flow = _Flow(instructions, stack_size)
+    if not flow.ok:
+        return list(instructions)
+    
+    removed, popped = set(), set()
+    # whether the next reference to each slot (when scanning backwards) reads it
+    read_next = [False] * len(flow.slots)
+    i = len(instructions) - 1
+    while i >= 0:
+        p = flow.referenced(instructions, i)
+        if p is not None:
+            if _reads(instructions[i]):
+                read_next[p] = True
+            elif read_next[p]:
+                read_next[p] = False
+            else:
+                start = flow.consumed[i]
+                if _cannot_fault(instructions, start, i - 1):
+                    removed.update(range(start, i + 1))
+                    # the loads in the removed expression are gone as well
+                    i = start - 1
+                    continue
+                popped.add(i)
+        i -= 1
+    return _rewrite(instructions, flow, removed, popped)
+
+
+# remove the consts and vars which are never read, with all the stores to them, and their slots if the values they
+# are declared with cannot fail to compute
+@VM_PASS.register('unused-vars')
+def remove_unused_vars(instructions: List[VMOperator], stack_size: int = VM.STACK_SIZE) -> List[VMOperator]:
+    flow = _Flow(instructions, stack_size)
+    if not flow.ok:
+        return list(instructions)
+    
+    read = set()
+    for i, op in enumerate(instructions):
+        p = flow.referenced(instructions, i)
+        if p is not None and _reads(op):
+            read.add(p)
+    removed, popped, dropped = set(), set(), set()
+    for i in range(len(instructions)):
+        p = flow.referenced(instructions, i)
+        if p is not None and p not in read:
+            start = flow.consumed[i]
+            if _cannot_fault(instructions, start, i - 1):
+                removed.update(range(start, i + 1))
+            else:
+                popped.add(i)
+    for p, (start, end) in enumerate(flow.slots):
+        if p not in read and _cannot_fault(instructions, start, end):
+            removed.update(range(start, end + 1))
+            dropped.add(p)
+    return _rewrite(instructions, flow, removed, popped, dropped)
+
+
+# let the vars whose declared values are never read share the slots of the others, as long as they are not live at
+# the same time: the live range of a slot spans from its first reference (or its declaration if the declared value is
+# read) to its last reference, and the ranges are packed into as few slots as possible from left to right
+@VM_PASS.register('compact-slots')
+def compact_slots(instructions: List[VMOperator], stack_size: int = VM.STACK_SIZE) -> List[VMOperator]:
+    flow = _Flow(instructions, stack_size)
+    if not flow.ok:
+        return list(instructions)
+    
+    n_slots = len(flow.slots)
+    first, last = [None] * n_slots, [None] * n_slots
+    for i in range(len(instructions)):
+        p = flow.referenced(instructions, i)
+        if p is not None:
+            if first[p] is None:
+                first[p] = i
+            last[p] = i
+    
+    # (the start of the live range, whether it may move, the end of the live range, slot)
+    ranges: List[Tuple[int, bool, int, int]] = []
+    removed, dropped, renamed = set(), set(), {}
+    for p, (start, end) in enumerate(flow.slots):
+        movable = (first[p] is None or not _reads(instructions[first[p]])) and _cannot_fault(instructions, start, end)
+        if movable and first[p] is None:
+            removed.update(range(start, end + 1))
+            dropped.add(p)
+        elif movable:
+            ranges.append((first[p], True, last[p], p))
+        else:
+            ranges.append((end, False, end if last[p] is None else last[p], p))
+    ranges.sort()
+    
+    # the slots kept, ordered by when they become free
+    free: List[Tuple[int, int]] = []
+    for start, movable, end, p in ranges:
+        if movable and len(free) and free[0][0] < start and flow.slots[free[0][1]][1] < start:
+            _, q = heapq.heappop(free)
+            start_p, end_p = flow.slots[p]
+            removed.update(range(start_p, end_p + 1))
+            dropped.add(p)
+            renamed[p] = q
+            heapq.heappush(free, (end, q))
+        else:
+            heapq.heappush(free, (end, p))
+    return _rewrite(instructions, flow, removed, (), dropped, renamed)
+
+
+# the number of instructions, the peak stack depth and the number of slots of the code
+def _measure(instructions: List[VMOperator], stack_size: int = VM.STACK_SIZE) -> Dict[str, int]:
+    flow = _Flow(instructions, stack_size)
+    return {'instructions': len(instructions), 'peak_stack': flow.peak, 'slots': len(flow.slots)}
+
+
+# run the passes (all of them by default, in the order of registration) one after another, returns the optimized code
+# and the stats of each pass
+# `stack_size` is that of the VM which will run the program: the passes never change whether it overflows the stack
+def run_passes(instructions: List[VMOperator], names: Sequence[str] = None, stack_size: int = VM.STACK_SIZE) -> Tuple[List[VMOperator], List[dict]]:
+    stats = []
+    before = _measure(instructions, stack_size)
+    for name in VM_PASS.keys() if names is None else names:
+        start = time.perf_counter()
+        instructions = VM_PASS[name](instructions, stack_size)
+        elapsed = time.perf_counter() - start
+        after = _measure(instructions, stack_size)
+        stats.append({'pass': name, 'seconds': elapsed, 'before': before, 'after': after})
+        before = after
+    return instructions, stats
+
+
+def report_pass_stats(stats: List[dict], fp: TextIO = None):
+    fp = fp or sys.stderr
+    print('\n============== passes ==============', file=fp)
+    print(f'{"pass":14s} {"ms":>8s} {"instructions":>16s} {"peak stack":>12s} {"slots":>10s}', file=fp)
+    for s in stats:
+        before, after = s['before'], s['after']
+        print(
+            f'{s["pass"]:14s} {s["seconds"] * 1e3:8.3f} {before["instructions"]:>7d} => {after["instructions"]:<6d}'
+            f' {before["peak_stack"]:>5d} => {after["peak_stack"]:<4d} {before["slots"]:>4d} => {after["slots"]:<4d}',
+            file=fp
+        )
+    print('====================================', file=fp)
@@ -0,0 +1,109 @@
+from typing import List
+
+from vm.impl import VM
+from vm.op import VMOperator, VM_OP_CLZ
+
+_LIT, _LOD, _STO, _WRT, _NEG = (VM_OP_CLZ[alias] for alias in ['LIT', 'LOD', 'STO', 'WRT', 'NEG'])
+# arithmetic operator => (the one fused with a preceding LIT, the one fused with a preceding LOD)
+_FUSIONS = {
+    VM_OP_CLZ[alias]: (VM_OP_CLZ[alias + 'I'], VM_OP_CLZ[alias + 'L'])
+    for alias in ['ADD', 'SUB', 'MUL', 'DIV']
+}
+_MUL, _DIV = VM_OP_CLZ['MUL'], VM_OP_CLZ['DIV']
+_FUSED_WITH_LIT = {fused_with_lit for fused_with_lit, _ in _FUSIONS.values()}
+_FUSED_WITH_LOD = {fused_with_lod for _, fused_with_lod in _FUSIONS.values()}
+
+
+# the rewritings below keep the semantics only if the program never touches the stack illegally (they may remove
+# pushes and pops), and never overflows it (they only lower the stack usage), which is always the case for the code
+# generated by `SyntacticAnalyzer` unless it references an uninitialized var
+# `stack_size` is that of the VM which will run the program, whose overflow must be kept as well
+def _is_well_formed(instructions: List[VMOperator], stack_size: int) -> bool:
+    sp = 0
+    for op in instructions:
+        clz = type(op)
+        if clz is _LIT:
+            if not -0x80000000 <= op.operand <= 0x7fffffff:
+                return False
+            sp += 1
+        elif clz is _LOD:
+            if not 0 <= op.operand < sp:
+                return False
+            sp += 1
+        elif clz is _STO:
+            if not 0 <= op.operand < sp:
+                return False
+            sp -= 1
+        elif clz in _FUSIONS:
+            if sp < 2:
+                return False
+            sp -= 1
+        elif clz is _WRT:
+            if sp < 1:
+                return False
+            sp -= 1
+        # superinstructions, so that the code can be optimized again
+        elif clz is _NEG or clz in _FUSED_WITH_LIT:
+            if sp < 1:
+                return False
+        elif clz in _FUSED_WITH_LOD:
+            if sp < 1 or not 0 <= op.operand < sp:
+                return False
+        else:
+            return False
+        if sp > stack_size:
+            return False
+    return True
+
+
+# rewrite sequences of instructions into fewer superinstructions:
+#   LIT 1; MUL  |  LIT 1; DIV    =>  (nothing)
+#   LIT -1; MUL |  LIT -1; DIV   =>  NEG
+#   LIT k; NEG                   =>  LIT -k
+#   LIT k; ADD                   =>  ADDI k   (SUB, MUL and DIV alike)
+#   LOD a; ADD                   =>  ADDL a   (SUB, MUL and DIV alike, so LOD a; LOD b; ADD becomes LOD a; ADDL b)
+# the arithmetic overflow and zero division errors are raised by the same operations as before
+def peephole_optimize(instructions: List[VMOperator], stack_size: int = VM.STACK_SIZE) -> List[VMOperator]:
+    if not _is_well_formed(instructions, stack_size):
+        return list(instructions)
+    
+    optimized: List[VMOperator] = []
+    for op in instructions:
+        clz = type(op)
+        prev = optimized[-1] if len(optimized) else None
+        prev_clz = type(prev)
+        
+        if clz in _FUSIONS and prev_clz is _LIT:
+            k = prev.operand
+            if k == 1 and clz in {_MUL, _DIV}:
+                optimized.pop()
+                continue
+            if k == -1 and clz in {_MUL, _DIV}:
+                optimized.pop()
+                op, clz = _NEG(), _NEG
+                prev = optimized[-1] if len(optimized) else None
+                prev_clz = type(prev)
+            else:
+                optimized[-1] = _FUSIONS[clz][0](k)
+                continue
+        elif clz in _FUSIONS and prev_clz is _LOD:
+            optimized[-1] = _FUSIONS[clz][1](prev.operand)
+            continue
+        
+        if clz is _NEG and prev_clz is _LIT and prev.operand != -0x80000000:
+            optimized[-1] = _LIT(-prev.operand)
+            continue
+        optimized.append(op)
+    
+    return optimized
+
+
+if __name__ == '__main__':
+    from lexical.dfa import DFATokenizer
+    from syntactic.analyzer import SyntacticAnalyzer
+    
+    with open('in.in', 'r') as fin:
+        ops = SyntacticAnalyzer(DFATokenizer(fin.read()).parse_stream()).generate_instructions()
+    optimized_ops = peephole_optimize(ops)
+    print(f'{len(ops)} => {len(optimized_ops)}')
+    print('\n'.join(str(op) for op in optimized_ops))
@@ -0,0 +1,118 @@
+import sys
+import time
+from collections import deque
+from typing import Deque, List, Optional, TextIO
+
+from vm.impl import VM
+
+
+# a program submitted to the `Scheduler`, with its budgets and how far it has gone
+class Job(object):
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    # the job is stopped when it runs out of a budget
+    OUT_OF_INSTRUCTIONS, OUT_OF_TIME = 'out of instructions', 'out of time'
+    
+    def __init__(self, vm: VM, name: str, max_instructions: int = None, max_seconds: float = None):
+        self.vm = vm
+        self.name = name
+        self.max_instructions = max_instructions
+        self.max_seconds = max_seconds
+        self.status = Job.PENDING
+        # the time spent in its slices, and the number of slices
+        self.seconds = 0.0
+        self.slices = 0
+    
+    # there are no jumps, so the number of instructions executed is where the VM stopped
+    @property
+    def executed(self) -> int:
+        return self.vm._ip
+    
+    @property
+    def finished(self) -> bool:
+        return self.status not in {Job.PENDING, Job.RUNNING}
+    
+    def progress(self) -> dict:
+        return {
+            'name': self.name, 'status': self.status, 'executed': self.executed, 'length': len(self.vm._code_seg),
+            'slices': self.slices, 'seconds': self.seconds,
+        }
+
+
+# interleaves many VMs in one thread: the jobs take turns in a run queue, each turn runs a slice of at most
+# `slice_size` instructions of one of them (see `VM.step`), and a job is stopped once it has used up its instruction
+# or time budget (the time is only checked between the slices)
+# the VMs should write into their own sinks (e.g. `vm.output.ListSink`), and the `VMErr`s are kept in `vm.error`
+class Scheduler(object):
+    SLICE_SIZE = 1 << 10
+    
+    def __init__(self, slice_size: int = SLICE_SIZE):
+        self.slice_size = slice_size
+        self.jobs: List[Job] = []
+        self._queue: Deque[Job] = deque()
+    
+    def submit(self, vm: VM, name: str = None, max_instructions: int = None, max_seconds: float = None) -> Job:
+        job = Job(vm, f'#{len(self.jobs)}' if name is None else name, max_instructions, max_seconds)
+        self.jobs.append(job)
+        self._queue.append(job)
+        return job
+    
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+    
+    # run one slice of the next job, returns the job (None if there are none left)
+    def run_slice(self) -> Optional[Job]:
+        if not self._queue:
+            return None
+        job = self._queue.popleft()
+        job.status = Job.RUNNING
+        n = self.slice_size
+        if job.max_instructions is not None:
+            n = min(n, job.max_instructions - job.executed)
+        
+        start = time.perf_counter()
+        ended = job.vm.step(n)
+        job.seconds += time.perf_counter() - start
+        job.slices += 1
+        
+        if ended:
+            job.status = Job.FAILED if job.vm.error is not None else Job.DONE
+        elif job.max_instructions is not None and job.executed >= job.max_instructions:
+            job.status = Job.OUT_OF_INSTRUCTIONS
+        elif job.max_seconds is not None and job.seconds >= job.max_seconds:
+            job.status = Job.OUT_OF_TIME
+        else:
+            self._queue.append(job)
+        if job.finished and not ended:
+            job.vm.output.flush()
+        return job
+    
+    # run till every job has finished
+    def run(self):
+        while self.run_slice() is not None:
+            pass
+    
+    def progress(self) -> List[dict]:
+        return [job.progress() for job in self.jobs]
+    
+    def report(self, fp: TextIO = None):
+        fp = fp or sys.stderr
+        print('\n=========== scheduler ===========', file=fp)
+        print(f'{"job":16s} {"status":20s} {"executed":>10s} {"slices":>7s} {"ms":>9s}', file=fp)
+        for p in self.progress():
+            executed = f'{p["executed"]}/{p["length"]}'
+            print(f'{p["name"]:16s} {p["status"]:20s} {executed:>10s} {p["slices"]:7d} {p["seconds"] * 1e3:9.3f}', file=fp)
+        print('=================================', file=fp)
+
+
+if __name__ == '__main__':
+    from vm.output import ListSink
+    
+    scheduler = Scheduler(slice_size=4)
+    scheduler.submit(VM('LIT 1\nLIT 2\nADD\nWRT\n' * 8, output=ListSink()), 'sum')
+    scheduler.submit(VM('LIT 1\nLIT 0\nDIV\n', output=ListSink()), 'div by zero')
+    scheduler.submit(VM('LIT 7\nWRT\n' * 100, output=ListSink()), 'capped', max_instructions=30)
+    scheduler.run()
+    scheduler.report(sys.stdout)
+    for job in scheduler.jobs:
+        print(job.name, job.vm.output.values, type(job.vm.error).__name__ if job.vm.error else '')
@@ -0,0 +1,103 @@
+from itertools import accumulate, chain, compress, islice
+from operator import ge, lt
+from typing import Optional, Sequence, Type
+
+from vm.err import VMAccessViolationErr, VMStackOverflowErr, VMErr
+from vm.op import VM_OP_CODE
+
+_ILL, _LIT, _LOD, _STO, _WRT, _NEG = (VM_OP_CODE[alias] for alias in ['ILL', 'LIT', 'LOD', 'STO', 'WRT', 'NEG'])
+_BINARY = {VM_OP_CODE[alias] for alias in ['ADD', 'SUB', 'MUL', 'DIV']}
+_IMMEDIATE = {VM_OP_CODE[alias] for alias in ['ADDI', 'SUBI', 'MULI', 'DIVI']}
+_LOADED = {VM_OP_CODE[alias] for alias in ['ADDL', 'SUBL', 'MULL', 'DIVL']}
+
+# opcode => how much it changes the stack depth, the least depth it leaves if it does not pop an empty stack, and
+# whether its operand is an offset into the stack
+# only the opcodes known to the verifier are in the tables, so that any other one fails the lookup
+_KNOWN = [_LIT, _LOD, _STO, _WRT, _NEG] + sorted(_BINARY | _IMMEDIATE | _LOADED)
+_DELTA, _MIN_AFTER, _HAS_OFFSET = dict.fromkeys(_KNOWN, 0), dict.fromkeys(_KNOWN, 0), dict.fromkeys(_KNOWN, False)
+for _code in [_LIT, _LOD]:
+    _DELTA[_code] = 1
+for _code in [_STO, _WRT] + sorted(_BINARY):
+    _DELTA[_code] = -1
+for _code in [_NEG] + sorted(_BINARY | _IMMEDIATE | _LOADED):
+    _MIN_AFTER[_code] = 1
+for _code in [_LOD, _STO] + sorted(_LOADED):
+    _HAS_OFFSET[_code] = True
+
+
+# the result of `verify`: `peak` is the maximum stack depth reached, and if the code may touch the stack illegally or
+# overflow it, `ip` is the first instruction which would, and `err` the error it raises (None if the instruction is
+# unknown to the verifier)
+class Verification(object):
+    def __init__(self, peak: int, ip: int = None, err: Optional[Type[VMErr]] = None):
+        self.peak = peak
+        self.ip = ip
+        self.err = err
+    
+    @property
+    def ok(self) -> bool:
+        return self.ip is None
+    
+    def __str__(self):
+        if self.ok:
+            return f'verified (peak stack depth {self.peak})'
+        if self.err is None:
+            return f'instruction {self.ip} cannot be verified'
+        return f'instruction {self.ip} raises {self.err.__name__}'
+
+
+# there are no jumps, so the stack depth before each instruction is known statically: the code is verified if no
+# instruction pops an empty stack, accesses an offset out of range or overflows the stack, and only the arithmetic
+# errors are left to be checked at runtime (the same resolution as `vm/jit.py`)
+# the code after an ILL is never executed, so it is not verified
+# the depths and the checks are computed by the builtins over whole columns, so that verifying a program costs much less
+# than running it; only if a check fails, the code is scanned again to find the first instruction which fails
+def verify(codes: Sequence[int], operands: Sequence[Optional[int]], stack_size: int) -> Verification:
+    executed = codes[:codes.index(_ILL)] if _ILL in codes else codes
+    try:
+        depths = list(chain((0,), accumulate(map(_DELTA.__getitem__, executed))))
+        min_after = map(_MIN_AFTER.__getitem__, executed)
+        ips = list(compress(range(len(executed)), map(_HAS_OFFSET.__getitem__, executed)))
+        offsets = list(map(operands.__getitem__, ips))
+    except (KeyError, IndexError):
+        # an opcode unknown to the verifier
+        return _locate(codes, operands, stack_size)
+    peak = max(depths)
+    if (
+        peak > stack_size or any(map(lt, islice(depths, 1, None), min_after))
+        or (offsets and (min(offsets) < 0 or any(map(ge, offsets, map(depths.__getitem__, ips)))))
+    ):
+        return _locate(codes, operands, stack_size)
+    return Verification(peak)
+
+
+def _locate(codes: Sequence[int], operands: Sequence[Optional[int]], stack_size: int) -> Verification:
+    sp = peak = 0
+    for ip, code in enumerate(codes):
+        if code == _LIT:
+            if sp >= stack_size:
+                return Verification(peak, ip, VMStackOverflowErr)
+            sp += 1
+        elif code == _LOD:
+            if not 0 <= operands[ip] < sp:
+                return Verification(peak, ip, VMAccessViolationErr)
+            if sp >= stack_size:
+                return Verification(peak, ip, VMStackOverflowErr)
+            sp += 1
+        elif code == _STO or code == _WRT:
+            if sp == 0 or (code == _STO and not 0 <= operands[ip] < sp):
+                return Verification(peak, ip, VMAccessViolationErr)
+            sp -= 1
+        elif code in _BINARY:
+            if sp < 2:
+                return Verification(peak, ip, VMAccessViolationErr)
+            sp -= 1
+        elif code == _NEG or code in _IMMEDIATE or code in _LOADED:
+            if sp == 0 or (code in _LOADED and not 0 <= operands[ip] < sp):
+                return Verification(peak, ip, VMAccessViolationErr)
+        elif code == _ILL:
+            break
+        else:
+            return Verification(peak, ip)
+        peak = max(peak, sp)
+    return Verification(peak)